@@ -0,0 +1,64 @@
+from bisect import bisect_left
+from threading import Lock
+
+from recipes.models import Ingredient, TableVersion
+
+
+class IngredientIndex:
+    """Отсортированный по названию список ингредиентов в памяти процесса.
+
+    Префиксный поиск идёт бинарным поиском по названиям, поиск по
+    вхождению подстроки - проходом по списку. Индекс перестраивается,
+    когда меняется версия таблицы ingredient в базе, так изменения видят
+    все процессы, включая импорт load_csv.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.built = False
+        self.version = None
+        # (названия в нижнем регистре, ингредиенты) заменяются одним
+        # присваиванием, чтобы поиск не увидел половину нового индекса.
+        self.entries = ([], [])
+
+    def build(self, version):
+        rows = sorted(
+            (name.lower(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator())
+        self.entries = ([row[0] for row in rows], [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in rows])
+        self.version, self.built = version, True
+
+    def refresh(self, version=None):
+        """Перестраивает индекс, если версия ingredient изменилась.
+
+        Версию, уже прочитанную для ETag запроса, можно передать, чтобы
+        не читать её из базы второй раз.
+        """
+        if version is None:
+            version = TableVersion.objects.get_versions(
+                ['ingredient'])['ingredient'][0]
+        if not self.built or version != self.version:
+            with self.lock:
+                if not self.built or version != self.version:
+                    self.build(version)
+
+    def search(self, query, limit, version=None):
+        self.refresh(version)
+        keys, ingredients = self.entries
+        query = query.lower()
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + '\U0010ffff', start)
+        result = ingredients[start:min(end, start + limit)]
+        if len(result) < limit:
+            for index, key in enumerate(keys):
+                if query in key and not start <= index < end:
+                    result.append(ingredients[index])
+                    if len(result) == limit:
+                        break
+        return result
+
+
+ingredient_index = IngredientIndex()
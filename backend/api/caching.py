@@ -0,0 +1,122 @@
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.db.models import Exists, OuterRef
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from recipes.models import Receipt, TableVersion
+from users.models import Subscribe
+
+RECEIPT_TABLES = ('tag', 'ingredient', 'user')
+RECEIPT_LIST_TABLES = ('receipt', 'tag', 'ingredient', 'user')
+RECEIPT_LIST_PARAMS = ('page', 'cursor', 'limit', 'author', 'tags',
+                       'search')
+CACHE_HITS_KEY = 'receipt_list:hits'
+CACHE_MISSES_KEY = 'receipt_list:misses'
+
+
+def get_table_versions(request, tables):
+    cache = request.__dict__.setdefault('_table_versions', {})
+    if tables not in cache:
+        cache[tables] = TableVersion.objects.get_versions(tables)
+    return cache[tables]
+
+
+def versioned(*tables, **cache_kwargs):
+    """Декораторы условного GET: ETag и Last-Modified по версиям таблиц."""
+    def etag(request, *args, **kwargs):
+        versions = get_table_versions(request, tables)
+        return 'W/"{}"'.format('-'.join(
+            f'{table}{versions[table][0]}' for table in tables))
+
+    def last_modified(request, *args, **kwargs):
+        return max((updated_at for _, updated_at
+                    in get_table_versions(request, tables).values()
+                    if updated_at), default=None)
+
+    return [cache_control(**cache_kwargs),
+            condition(etag_func=etag, last_modified_func=last_modified)]
+
+
+def get_receipt_state(request, pk):
+    cache = request.__dict__.setdefault('_receipt_state', {})
+    if pk not in cache:
+        try:
+            queryset = Receipt.objects.with_user_flags(
+                request.user).filter(pk=int(pk))
+        except (TypeError, ValueError):
+            return None
+        fields = ['updated_at']
+        if request.user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscribe.objects.filter(
+                    user=request.user, author=OuterRef('author'))))
+            fields += ['is_favorited', 'is_in_shopping_cart', 'is_subscribed']
+        cache[pk] = queryset.values_list(*fields).first()
+    return cache[pk]
+
+
+def receipt_etag(request, pk):
+    state = get_receipt_state(request, pk)
+    if state is None:
+        return None
+    versions = get_table_versions(request, RECEIPT_TABLES)
+    return 'W/"receipt{}-{}-{}"'.format(
+        pk, state[0].timestamp(),
+        '-'.join([str(versions[table][0]) for table in RECEIPT_TABLES]
+                 + [str(int(flag)) for flag in state[1:]]))
+
+
+def receipt_last_modified(request, pk):
+    state = get_receipt_state(request, pk)
+    if state is None:
+        return None
+    return max([state[0]] + [
+        updated_at for _, updated_at
+        in get_table_versions(request, RECEIPT_TABLES).values()
+        if updated_at])
+
+
+def versioned_receipt(**cache_kwargs):
+    return [cache_control(**cache_kwargs),
+            condition(etag_func=receipt_etag,
+                      last_modified_func=receipt_last_modified)]
+
+
+def receipt_list_cache_key(request):
+    """Ключ страницы списка рецептов для анонимного пользователя.
+
+    Параметры фильтрации нормализуются (сортировка, без повторов и
+    пустых значений), а версии таблиц в ключе делают недоступными все
+    закэшированные страницы после записи в рецепты, тэги, ингредиенты
+    или пользователей.
+    """
+    params = sorted(
+        (name, value)
+        for name in RECEIPT_LIST_PARAMS
+        for value in set(request.query_params.getlist(name))
+        if (value or name == 'cursor') and (name, value) != ('page', '1'))
+    versions = get_table_versions(request, RECEIPT_LIST_TABLES)
+    raw = '|'.join([request.get_host(), urlencode(params)] + [
+        str(versions[table][0]) for table in RECEIPT_LIST_TABLES])
+    return 'receipt_list:' + md5(raw.encode()).hexdigest()
+
+
+def count_cache_access(cache, hit):
+    key = CACHE_HITS_KEY if hit else CACHE_MISSES_KEY
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_cache_stats():
+    cache = caches['recipes']
+    return {'hits': cache.get(CACHE_HITS_KEY, 0),
+            'misses': cache.get(CACHE_MISSES_KEY, 0)}
+
+
+def reset_cache_stats():
+    caches['recipes'].delete_many([CACHE_HITS_KEY, CACHE_MISSES_KEY])
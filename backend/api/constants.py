@@ -1 +1,29 @@
 MAX_PASSWORD_LENGTH = 128
+
+PDF_PAGE_WIDTH = 595
+PDF_PAGE_HEIGHT = 842
+PDF_MARGIN = 50
+PDF_FONT_SIZE = 12
+PDF_LEADING = 15
+PDF_LINES_PER_PAGE = 48
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+TAG_MAX_AGE = 60 * 60
+INGREDIENT_MAX_AGE = 24 * 60 * 60
+
+MAX_PAGE_SIZE = 100
+
+MATCH_MAX_INGREDIENTS = 30
+
+# Профилирование запросов: сколько самых медленных SQL хранить на view,
+# со скольких повторов одного SQL за запрос считать его N+1.
+PROFILING_SLOW_QUERIES = 5
+PROFILING_REPEAT_THRESHOLD = 10
+PROFILING_SQL_LENGTH = 500
+
+MAX_IMAGE_SIZE = 15 * 1024 * 1024
+IMAGE_FORMATS = ('jpeg', 'jpg', 'png', 'gif', 'webp')
+BASE64_CHUNK_SIZE = 64 * 1024
+IMAGE_VARIANT_FORMAT = 'webp'
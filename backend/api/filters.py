@@ -15,6 +15,7 @@ class ReceiptFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = CharFilter(method='get_search')
 
     class Meta:
         model = Receipt
@@ -30,10 +31,17 @@ class ReceiptFilter(FilterSet):
             return queryset.filter(shopping_carts__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        return queryset.search(value)
+
 
 class IngredientFilter(FilterSet):
     name = CharFilter(lookup_expr='icontains')
+    search = CharFilter(method='get_search')
 
     class Meta:
         model = Ingredient
         fields = ['name']
+
+    def get_search(self, queryset, name, value):
+        return queryset.search(value)
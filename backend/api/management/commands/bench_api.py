@@ -0,0 +1,227 @@
+import json
+import random
+import subprocess
+import time
+from math import ceil
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Ingredient, Receipt, ShoppingCart, Tag
+from users.models import Subscribe, User
+
+SAMPLE_SIZE = 100
+
+
+def percentile(values, share):
+    """Значение, не меньше которого доля share всех значений."""
+    values = sorted(values)
+    return values[max(0, ceil(len(values) * share) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет основные эндпоинты API через тестовый клиент DRF и '
+            'выводит p50/p95 времени ответа и число запросов к базе в '
+            'JSON. С --compare сравнивает с сохранённым прошлым замером. '
+            'Данные для замера создаёт seed_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Запросов к каждому эндпоинту')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Неучитываемых запросов перед замером')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', action='append', metavar='NAME',
+                            help='Замерить только эти эндпоинты')
+        parser.add_argument('--output', help='Записать JSON в файл')
+        parser.add_argument('--compare', metavar='PATH',
+                            help='JSON прошлого замера для сравнения')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Допустимый рост p95, доля')
+
+    def handle(self, *args: Any, **options: Any):
+        rand = random.Random(options['seed'])
+        self.load_sample(rand)
+        scenarios = self.scenarios()
+        if options['only']:
+            unknown = set(options['only']) - set(scenarios)
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}. '
+                    f'Доступны: {", ".join(scenarios)}')
+            scenarios = {name: scenarios[name] for name in options['only']}
+        results = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, (path, make_request) in scenarios.items():
+                results[name] = self.measure(
+                    rand, path, make_request, options['repeat'],
+                    options['warmup'])
+        report = {
+            'commit': self.commit(),
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'seed': options['seed'],
+            'data': {
+                'users': User.objects.count(),
+                'recipes': Receipt.objects.count(),
+                'ingredients': Ingredient.objects.count(),
+                'subscriptions': Subscribe.objects.count(),
+                'favorites': Favorite.objects.count(),
+                'shopping_carts': ShoppingCart.objects.count(),
+            },
+            'endpoints': results,
+        }
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        if options['compare']:
+            self.compare(options['compare'], report, options['threshold'])
+
+    def load_sample(self, rand):
+        def sample(queryset):
+            ids = list(queryset.values_list('id', flat=True).distinct())
+            return rand.sample(ids, min(SAMPLE_SIZE, len(ids)))
+
+        self.recipes = sample(Receipt.objects.order_by('id'))
+        if not self.recipes:
+            raise CommandError('В базе нет рецептов, запустите seed_data')
+        self.authors = sample(User.objects.filter(
+            recipes__isnull=False).order_by('id'))
+        users = User.objects.in_bulk(sample(User.objects.filter(
+            shopping_carts__isnull=False, subscriber__isnull=False,
+            favorites__isnull=False).order_by('id')))
+        self.users = [users[pk] for pk in sorted(users)]
+        if not self.users:
+            raise CommandError('Нет пользователей с подписками, избранным '
+                               'и корзиной, запустите seed_data')
+        self.tags = list(Tag.objects.order_by('id').values_list(
+            'slug', flat=True))
+        self.words = sorted({
+            word[:4].lower() for name in Ingredient.objects.filter(
+                pk__in=sample(Ingredient.objects.order_by('id'))
+            ).values_list('name', flat=True)
+            for word in name.split()[:1] if len(word) >= 4})
+        self.names = [name.split()[0] for name in Receipt.objects.filter(
+            pk__in=self.recipes[:10]).values_list('name', flat=True)]
+
+    def scenarios(self):
+        """{имя: (путь для отчёта, функция rand -> (url, параметры,
+        пользователь или None))}."""
+        def page(rand):
+            return {'page': rand.randint(1, 5), 'limit': 6}
+
+        def user(rand):
+            return rand.choice(self.users)
+
+        return {
+            'recipes_list_anonymous': ('/api/recipes/', lambda rand: (
+                '/api/recipes/', page(rand), None)),
+            'recipes_list': ('/api/recipes/', lambda rand: (
+                '/api/recipes/', page(rand), user(rand))),
+            'recipes_list_tags': ('/api/recipes/?tags=', lambda rand: (
+                '/api/recipes/', {**page(rand), 'tags': rand.sample(
+                    self.tags, min(2, len(self.tags)))}, user(rand))),
+            'recipes_list_author': ('/api/recipes/?author=', lambda rand: (
+                '/api/recipes/', {'author': rand.choice(self.authors),
+                                  'limit': 6}, user(rand))),
+            'recipes_list_favorited': (
+                '/api/recipes/?is_favorited=1', lambda rand: (
+                    '/api/recipes/', {'is_favorited': 1, 'limit': 6},
+                    user(rand))),
+            'recipes_list_in_cart': (
+                '/api/recipes/?is_in_shopping_cart=1', lambda rand: (
+                    '/api/recipes/', {'is_in_shopping_cart': 1, 'limit': 6},
+                    user(rand))),
+            'recipes_search': ('/api/recipes/?search=', lambda rand: (
+                '/api/recipes/', {'search': rand.choice(self.names),
+                                  'limit': 6}, user(rand))),
+            'recipe_detail': ('/api/recipes/{id}/', lambda rand: (
+                f'/api/recipes/{rand.choice(self.recipes)}/', {},
+                user(rand))),
+            'subscriptions': (
+                '/api/users/subscriptions/', lambda rand: (
+                    '/api/users/subscriptions/', {'recipes_limit': 3},
+                    user(rand))),
+            'download_shopping_cart': (
+                '/api/recipes/download_shopping_cart/', lambda rand: (
+                    '/api/recipes/download_shopping_cart/', {},
+                    user(rand))),
+            'ingredients_search': ('/api/ingredients/?name=', lambda rand: (
+                '/api/ingredients/', {'name': rand.choice(self.words)},
+                None)),
+            'ingredients_autocomplete': (
+                '/api/ingredients/autocomplete/', lambda rand: (
+                    '/api/ingredients/autocomplete/',
+                    {'name': rand.choice(self.words)}, None)),
+        }
+
+    def measure(self, rand, path, make_request, repeat, warmup):
+        client = APIClient()
+        timings, queries, errors = [], [], 0
+        for number in range(warmup + repeat):
+            url, params, user = make_request(rand)
+            client.force_authenticate(user)
+            start = time.perf_counter()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url, params)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+            if number < warmup:
+                continue
+            timings.append(elapsed)
+            queries.append(len(context))
+            errors += response.status_code >= 400
+        return {
+            'path': path,
+            'requests': repeat,
+            'errors': errors,
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+            'max_ms': round(max(timings) * 1000, 2),
+            'queries_p50': percentile(queries, 0.5),
+            'queries_max': max(queries),
+        }
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                check=True, text=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def compare(self, path, report, threshold):
+        """Печатает изменения относительно прошлого замера в stderr, чтобы
+        не смешивать их с JSON; при регрессиях завершается с ошибкой."""
+        try:
+            with open(path, encoding='utf-8') as file:
+                previous = json.load(file)['endpoints']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        regressions = []
+        for name, current in report['endpoints'].items():
+            before = previous.get(name)
+            if before is None:
+                self.stderr.write(f'{name}: нет в прошлом замере')
+                continue
+            change = current['p95_ms'] / before['p95_ms'] - 1
+            self.stderr.write(
+                f'{name}: p50 {before["p50_ms"]} -> {current["p50_ms"]} мс, '
+                f'p95 {before["p95_ms"]} -> {current["p95_ms"]} мс '
+                f'({change:+.0%}), запросов {before["queries_max"]} -> '
+                f'{current["queries_max"]}')
+            if (change > threshold
+                    or current['queries_max'] > before['queries_max']
+                    or current['errors'] > before['errors']):
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f'Регрессии: {", ".join(regressions)}')
@@ -0,0 +1,144 @@
+import random
+import time
+from itertools import accumulate
+from typing import Any
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import ReceiptViewSet
+from recipes.management.seeding import SeedingCommand
+from recipes.models import Receipt, TimelineEntry
+from users.models import Subscribe, User
+
+BATCH_SIZE = 5000
+
+
+class Command(SeedingCommand):
+    help = ('Замеряет раскладку рецептов по лентам подписчиков и '
+            '/api/recipes/feed/. Досоздаёт пользователей, подписки и '
+            'рецепты до заданных количеств, поэтому запускать на '
+            'отдельной базе с --yes-seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--authors', type=int, default=2000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя')
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args: Any, **options: Any):
+        rand = random.Random(0)
+        self.seed(rand, options['users'], options['authors'],
+                  options['follows'])
+        authors = list(User.objects.order_by('id').values_list(
+            'id', flat=True)[:options['authors']])
+        weights = list(accumulate(
+            1 / rank for rank in range(1, len(authors) + 1)))
+        missing = options['recipes'] - Receipt.objects.count()
+        timings, rows = [], []
+        for _ in range(max(missing, 0)):
+            author_id = rand.choices(authors, cum_weights=weights)[0]
+            before = TimelineEntry.objects.count() if len(rows) < 100 else 0
+            start = time.perf_counter()
+            Receipt.objects.create(
+                author_id=author_id, cooking_time=30, text='Описание',
+                name='Рецепт', image='images/recipes/bench.png')
+            timings.append(time.perf_counter() - start)
+            if len(rows) < 100:
+                rows.append(TimelineEntry.objects.count() - before)
+        if timings:
+            self.report('Создание рецепта с раскладкой', timings)
+            self.stdout.write(f'Записей ленты на рецепт (первые 100): '
+                              f'медиана {sorted(rows)[len(rows) // 2]}, '
+                              f'максимум {max(rows)}')
+        self.stdout.write(
+            f'Записей в лентах: {TimelineEntry.objects.count()}, авторов '
+            f'с чтением при запросе: '
+            f'{User.objects.filter(fan_out_on_read=True).count()}')
+
+        users = User.objects.filter(subscriber__isnull=False).distinct()
+        user_ids = list(users.values_list('id', flat=True))
+        sample = User.objects.in_bulk(rand.sample(
+            user_ids, min(options['repeat'], len(user_ids)))).values()
+        timings = []
+        for user in sample:
+            start = time.perf_counter()
+            list(Receipt.objects.filter(author__creator__user=user).order_by(
+                '-id').values_list('id', flat=True)[:10])
+            timings.append(time.perf_counter() - start)
+        self.report('id первой страницы соединением Subscribe и Receipt',
+                    timings)
+        timings = []
+        for user in sample:
+            start = time.perf_counter()
+            TimelineEntry.objects.feed_ids(user, limit=11)
+            timings.append(time.perf_counter() - start)
+        self.report('id первой страницы из ленты', timings)
+
+        view = ReceiptViewSet.as_view({'get': 'feed'})
+        factory = APIRequestFactory()
+        self.cursors = {}
+        for name, follow in (('первая страница', False),
+                             ('вторая страница', True)):
+            timings, queries = [], 0
+            for user in sample:
+                params = {'limit': 10}
+                if follow:
+                    params['cursor'] = self.cursors.get(user.pk)
+                    if params['cursor'] is None:
+                        continue
+                request = factory.get('/api/recipes/feed/', params)
+                force_authenticate(request, user)
+                start = time.perf_counter()
+                with override_settings(ALLOWED_HOSTS=['testserver']), \
+                        CaptureQueriesContext(connection) as context:
+                    response = view(request)
+                    response.render()
+                timings.append(time.perf_counter() - start)
+                queries = max(queries, len(context))
+                if not follow and response.data['next']:
+                    self.cursors[user.pk] = response.data['next'].partition(
+                        'cursor=')[2]
+            if timings:
+                self.report(f'{name} API (до {queries} запросов)', timings)
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        self.stdout.write(
+            f'{name}: p50 {timings[len(timings) // 2] * 1000:.1f} мс, '
+            f'p95 {timings[int(len(timings) * 0.95)] * 1000:.1f} мс, '
+            f'максимум {timings[-1] * 1000:.1f} мс')
+
+    def seed(self, rand, users, authors, follows):
+        missing = users - User.objects.count()
+        for offset in range(0, max(missing, 0), BATCH_SIZE):
+            User.objects.bulk_create(
+                User(username=f'bench feed {offset + index}',
+                     email=f'bench-feed-{offset + index}@example.com')
+                for index in range(min(BATCH_SIZE, missing - offset)))
+        if Subscribe.objects.count() >= users:
+            return
+        author_ids = list(User.objects.order_by('id').values_list(
+            'id', flat=True)[:authors])
+        # Число подписчиков автора распределено по Ципфу: у первых
+        # авторов их десятки тысяч, у большинства - сотни.
+        weights = list(accumulate(
+            1 / rank for rank in range(1, len(author_ids) + 1)))
+        batch = []
+        for user_id in User.objects.values_list('id', flat=True).iterator():
+            count = min(len(author_ids), 1 + int(rand.expovariate(
+                1 / follows)))
+            batch.extend(
+                Subscribe(user_id=user_id, author_id=author_id)
+                for author_id in set(rand.choices(
+                    author_ids, cum_weights=weights, k=count))
+                if author_id != user_id)
+            if len(batch) >= BATCH_SIZE:
+                Subscribe.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        Subscribe.objects.bulk_create(batch, ignore_conflicts=True)
+        call_command('rebuild_counters', stdout=self.stdout)
@@ -0,0 +1,39 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from api.autocomplete import ingredient_index
+from api.constants import AUTOCOMPLETE_LIMIT
+from api.filters import IngredientFilter
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает автодополнение ингредиентов по индексу в памяти '
+            'с фильтром name__icontains')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', nargs='+',
+                            default=['а', 'мо', 'мол', 'сыр', 'томат'])
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args: Any, **options: Any):
+        ingredient_index.refresh()
+        for query in options['queries']:
+            filter_time = measure(options['repeat'], lambda: list(
+                IngredientFilter({'name': query},
+                                 Ingredient.objects.all()).qs.values(
+                    'id', 'name', 'measurement_unit')))
+            index_time = measure(options['repeat'], lambda: (
+                ingredient_index.search(query, AUTOCOMPLETE_LIMIT)))
+            self.stdout.write(
+                f'{query}: фильтр {filter_time * 1000:.3f} мс, '
+                f'индекс {index_time * 1000:.3f} мс')
+
+
+def measure(repeat, func):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
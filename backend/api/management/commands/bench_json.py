@@ -0,0 +1,69 @@
+import io
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.views import ReceiptViewSet
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает JSONRenderer и JSONParser DRF с FastJSONRenderer и '
+            'FastJSONParser на странице списка рецептов. Рецепты создаёт '
+            'seed_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100,
+                            help='Рецептов на странице')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args: Any, **options: Any):
+        user = User.objects.filter(favorites__isnull=False).first()
+        request = APIRequestFactory().get('/api/recipes/', {
+            'limit': options['recipes']})
+        force_authenticate(request, user)
+        view = ReceiptViewSet.as_view({'get': 'list'})
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            start = time.perf_counter()
+            data = view(request).data
+            elapsed = time.perf_counter() - start
+        if len(data['results']) < options['recipes']:
+            raise CommandError(f'В базе меньше {options["recipes"]} '
+                               f'рецептов, запустите seed_data')
+        self.stdout.write(
+            f'orjson: {"нет" if orjson is None else orjson.__version__}, '
+            f'страница из {options["recipes"]} рецептов, ответ без '
+            f'рендеринга {elapsed * 1000:.1f} мс')
+
+        content = JSONRenderer().render(data)
+        fast_content = FastJSONRenderer().render(data)
+        self.stdout.write(
+            f'Размер {len(content)} байт, результат '
+            f'{"совпадает" if content == fast_content else "РАЗЛИЧАЕТСЯ"}')
+        for name, render in (
+                ('JSONRenderer', JSONRenderer().render),
+                ('FastJSONRenderer', FastJSONRenderer().render)):
+            self.report(name, options['repeat'], lambda: render(data))
+        for name, parse in (
+                ('JSONParser', JSONParser().parse),
+                ('FastJSONParser', FastJSONParser().parse)):
+            self.report(name, options['repeat'],
+                        lambda: parse(io.BytesIO(content)))
+
+    def report(self, name, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        self.stdout.write(
+            f'{name}: медиана {timings[len(timings) // 2] * 1000:.2f} мс, '
+            f'p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} мс')
@@ -0,0 +1,106 @@
+import random
+import time
+from datetime import timedelta
+from typing import Any
+
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from api.views import ReceiptViewSet
+from recipes.management.seeding import SeedingCommand
+from recipes.models import Favorite, Receipt, RecipePopularity, Tag
+from users.models import User
+
+BATCH_SIZE = 5000
+
+
+class Command(SeedingCommand):
+    help = ('Замеряет пересчёт рейтинга популярности и /api/recipes/popular/. '
+            'Досоздаёт пользователей, рецепты и избранное до заданных '
+            'количеств, поэтому запускать на отдельной базе с --yes-seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--favorites', type=int, default=1000000)
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args: Any, **options: Any):
+        self.seed(options['users'], options['recipes'], options['favorites'])
+        start = time.perf_counter()
+        total = RecipePopularity.objects.rebuild()
+        self.stdout.write(
+            f'Пересчёт рейтинга: {Favorite.objects.count()} добавлений в '
+            f'избранное, {total} рецептов, '
+            f'{time.perf_counter() - start:.1f} с')
+
+        start = time.perf_counter()
+        list(Receipt.objects.annotate(total=Count('favorites')).order_by(
+            '-total', '-id').values_list('id', flat=True)[:10])
+        self.stdout.write(f'Подсчёт на лету без затухания, первые 10: '
+                          f'{(time.perf_counter() - start) * 1000:.1f} мс')
+
+        tag = Tag.objects.first()
+        view = ReceiptViewSet.as_view({'get': 'popular'})
+        factory = APIRequestFactory()
+        cursor = None
+        for name, params in (('первая страница', {}),
+                             ('по тегу', {'tags': tag.slug} if tag else {}),
+                             ('вторая страница', None)):
+            if params is None:
+                params = {'cursor': cursor}
+            best, queries = None, 0
+            for _ in range(options['repeat']):
+                request = factory.get('/api/recipes/popular/', params)
+                start = time.perf_counter()
+                with override_settings(ALLOWED_HOSTS=['testserver']), \
+                        CaptureQueriesContext(connection) as context:
+                    response = view(request)
+                    response.render()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+                queries = len(context)
+            if cursor is None and response.data['next']:
+                cursor = response.data['next'].partition('cursor=')[2]
+            self.stdout.write(f'{name}: {best * 1000:.1f} мс, '
+                              f'{queries} запросов')
+
+    def seed(self, users, recipes, favorites):
+        rand = random.Random(0)
+        missing = users - User.objects.count()
+        for offset in range(0, max(missing, 0), BATCH_SIZE):
+            User.objects.bulk_create(
+                User(username=f'bench popular {offset + index}',
+                     email=f'bench-popular-{offset + index}@example.com')
+                for index in range(min(BATCH_SIZE, missing - offset)))
+        author = User.objects.order_by('id').first()
+        missing = recipes - Receipt.objects.count()
+        for offset in range(0, max(missing, 0), BATCH_SIZE):
+            Receipt.objects.bulk_create(
+                Receipt(author=author, cooking_time=30, text='Описание',
+                        name=f'Рецепт {offset + index}',
+                        image='images/recipes/bench.png')
+                for index in range(min(BATCH_SIZE, missing - offset)))
+        missing = favorites - Favorite.objects.count()
+        if missing <= 0:
+            return
+        user_ids = list(User.objects.values_list('id', flat=True))
+        # Популярность рецептов распределена неравномерно: чем меньше
+        # номер в списке, тем чаще рецепт добавляют.
+        recipe_ids = list(Receipt.objects.values_list('id', flat=True))
+        now = timezone.now()
+        while missing > 0:
+            batch = [
+                Favorite(user_id=rand.choice(user_ids),
+                         recipe_id=recipe_ids[
+                             int(len(recipe_ids) * rand.random() ** 3)],
+                         created=now - timedelta(
+                             seconds=rand.randrange(90 * 24 * 60 * 60)))
+                for _ in range(min(BATCH_SIZE, missing))]
+            Favorite.objects.bulk_create(batch, ignore_conflicts=True)
+            missing = favorites - Favorite.objects.count()
+        self.stdout.write('Данные созданы, счётчики можно исправить '
+                          'командой rebuild_counters')
@@ -0,0 +1,52 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import ReceiptGetSerializer, ReceiptReadSerializer
+from recipes.models import Receipt
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает ReceiptGetSerializer и ReceiptReadSerializer на '
+            'странице списка рецептов, уже загруженной из базы. Рецепты '
+            'создаёт seed_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100,
+                            help='Рецептов на странице')
+        parser.add_argument('--repeat', type=int, default=100)
+
+    def handle(self, *args: Any, **options: Any):
+        user = User.objects.filter(favorites__isnull=False).first()
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        context = {'request': request}
+        page = list(Receipt.objects.for_representation(user)[
+            :options['recipes']])
+        if len(page) < options['recipes']:
+            raise CommandError(f'В базе меньше {options["recipes"]} '
+                               f'рецептов, запустите seed_data')
+        medians = {}
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for serializer_class in (ReceiptGetSerializer,
+                                     ReceiptReadSerializer):
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    serializer_class(page, many=True, context=context).data
+                    timings.append(time.perf_counter() - start)
+                timings.sort()
+                name = serializer_class.__name__
+                medians[name] = timings[len(timings) // 2]
+                self.stdout.write(
+                    f'{name}, {len(page)} рецептов: медиана '
+                    f'{medians[name] * 1000:.2f} мс, p95 '
+                    f'{timings[int(len(timings) * 0.95)] * 1000:.2f} мс')
+        speedup = (medians['ReceiptGetSerializer']
+                   / medians['ReceiptReadSerializer'])
+        self.stdout.write(f'Ускорение: {speedup:.1f}x')
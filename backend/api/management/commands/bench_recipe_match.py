@@ -0,0 +1,134 @@
+import random
+import time
+from itertools import accumulate
+from typing import Any
+
+from django.db import connection
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from api.recipe_match import recipe_match_index
+from api.views import ReceiptViewSet
+from recipes.management.seeding import SeedingCommand
+from recipes.models import Ingredient, Receipt, ReceiptIngredient
+from users.models import User
+
+BATCH_SIZE = 5000
+
+
+class Command(SeedingCommand):
+    help = ('Замеряет поиск рецептов по имеющимся ингредиентам. '
+            'Досоздаёт рецепты до заданного количества, поэтому запускать '
+            'на отдельной базе с --yes-seed.')
+    weights = ()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=500000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8,
+                            help='Среднее число ингредиентов в рецепте')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--sql', action='store_true',
+                            help='Сравнить с подсчётом совпадений в SQL')
+
+    def handle(self, *args: Any, **options: Any):
+        rand = random.Random(0)
+        ingredient_ids = self.seed(rand, options['recipes'],
+                                   options['ingredients'],
+                                   options['per_recipe'])
+        start = time.perf_counter()
+        index = recipe_match_index
+        index.refresh()
+        self.stdout.write(
+            f'Построение индекса: {Receipt.objects.count()} рецептов, '
+            f'{time.perf_counter() - start:.1f} с')
+
+        queries = [self.pick(rand, ingredient_ids, size)
+                   for size in (3, 5, 10) for _ in range(options['repeat'])]
+        timings = []
+        for ids in queries:
+            start = time.perf_counter()
+            index.search(ids)
+            timings.append(time.perf_counter() - start)
+        self.report('Поиск в индексе', timings)
+
+        view = ReceiptViewSet.as_view({'get': 'by_ingredients'})
+        factory = APIRequestFactory()
+        timings, count = [], 0
+        for ids in queries:
+            request = factory.get('/api/recipes/by_ingredients/', {
+                'ingredients': ','.join(map(str, ids)), 'limit': 10})
+            start = time.perf_counter()
+            with override_settings(ALLOWED_HOSTS=['testserver']), \
+                    CaptureQueriesContext(connection) as context:
+                response = view(request)
+                response.render()
+            timings.append(time.perf_counter() - start)
+            count = max(count, len(context))
+        self.report(f'Первая страница API (до {count} запросов)', timings)
+
+        if options['sql']:
+            timings = []
+            for ids in queries[::options['repeat']]:
+                start = time.perf_counter()
+                list(Receipt.objects.annotate(
+                    matched=Count('receipt_ingredient', filter=Q(
+                        receipt_ingredient__ingredient_id__in=ids)),
+                    total=Count('receipt_ingredient'),
+                ).filter(matched__gt=0).order_by(
+                    (Cast('matched', FloatField()) / F('total')).desc(),
+                    '-matched', '-id').values_list('id', flat=True)[:10])
+                timings.append(time.perf_counter() - start)
+            self.report('Подсчёт совпадений в SQL', timings)
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        self.stdout.write(
+            f'{name}: медиана {timings[len(timings) // 2] * 1000:.1f} мс, '
+            f'максимум {timings[-1] * 1000:.1f} мс')
+
+    def pick(self, rand, ingredient_ids, count=1):
+        # Частоты ингредиентов распределены по Ципфу: соль и лук есть
+        # почти везде, большинство остальных встречается редко.
+        if len(self.weights) != len(ingredient_ids):
+            self.weights = list(accumulate(
+                1 / rank for rank in range(1, len(ingredient_ids) + 1)))
+        return rand.choices(ingredient_ids, cum_weights=self.weights,
+                            k=count)
+
+    def seed(self, rand, recipes, ingredients, per_recipe):
+        missing = ingredients - Ingredient.objects.count()
+        if missing > 0:
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+                for index in range(missing))
+        ingredient_ids = list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True))
+        author = User.objects.order_by('id').first()
+        if author is None:
+            author = User.objects.create(username='bench match',
+                                         email='bench-match@example.com')
+        missing = recipes - Receipt.objects.count()
+        for offset in range(0, max(missing, 0), BATCH_SIZE):
+            batch = Receipt.objects.bulk_create(
+                Receipt(author=author, cooking_time=30, text='Описание',
+                        name=f'Рецепт {offset + index}',
+                        image='images/recipes/bench.png')
+                for index in range(min(BATCH_SIZE, missing - offset)))
+            if batch[0].pk is None:
+                batch = Receipt.objects.order_by('-id')[:len(batch)]
+            items = []
+            for recipe in batch:
+                chosen = set(self.pick(rand, ingredient_ids, max(
+                    1, int(rand.gauss(per_recipe, per_recipe / 3)))))
+                items.extend(ReceiptIngredient(recipe_id=recipe.pk,
+                                               ingredient_id=ingredient_id,
+                                               amount=1)
+                             for ingredient_id in chosen)
+            ReceiptIngredient.objects.bulk_create(items)
+        if missing > 0:
+            self.stdout.write('Данные созданы, счётчики можно исправить '
+                              'командой rebuild_counters')
+        return ingredient_ids
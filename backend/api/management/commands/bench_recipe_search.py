@@ -0,0 +1,54 @@
+import random
+import time
+from typing import Any
+
+
+from recipes.management.seeding import SeedingCommand
+from recipes.models import Ingredient, Receipt
+from users.models import User
+
+WORDS = ['борщ', 'суп', 'салат', 'пирог', 'котлеты', 'каша', 'плов',
+         'запеканка', 'блины', 'омлет', 'курица', 'говядина', 'рыба',
+         'грибы', 'сыр', 'картофель', 'томаты', 'тыква', 'яблоки', 'мёд',
+         'домашний', 'быстрый', 'острый', 'сладкий', 'праздничный']
+BATCH_SIZE = 5000
+
+
+class Command(SeedingCommand):
+    help = ('Замеряет поиск рецептов и ингредиентов. Досоздаёт рецепты '
+            'до --recipes, поэтому запускать на отдельной базе с --yes-seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--queries', nargs='+',
+                            default=['борщ', 'острый суп', 'курица сыр'])
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args: Any, **options: Any):
+        self.seed(options['recipes'])
+        for query in options['queries']:
+            for name, queryset in (
+                    ('рецепты', Receipt.objects.search(query)),
+                    ('ингредиенты', Ingredient.objects.search(query))):
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    count = len(queryset[:20].values_list('id', flat=True))
+                elapsed = (time.perf_counter() - start) / options['repeat']
+                self.stdout.write(f'{name} "{query}": {count} результатов, '
+                                  f'{elapsed * 1000:.1f} мс')
+
+    def seed(self, total):
+        missing = total - Receipt.objects.count()
+        if missing <= 0:
+            return
+        author, _ = User.objects.get_or_create(
+            username='bench', defaults={'email': 'bench@example.com'})
+        rand = random.Random(0)
+        for offset in range(0, missing, BATCH_SIZE):
+            Receipt.objects.bulk_create(
+                Receipt(author=author, cooking_time=rand.randint(1, 180),
+                        image='images/recipes/bench.png',
+                        name=' '.join(rand.sample(WORDS, 3)),
+                        text=' '.join(rand.choices(WORDS, k=30)))
+                for _ in range(min(BATCH_SIZE, missing - offset)))
+        self.stdout.write(f'Создано рецептов: {missing}')
@@ -0,0 +1,101 @@
+import time
+from typing import Any
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api.serializers import ReceiptCreateSerializer
+from recipes.management.seeding import SeedingCommand
+from recipes.models import Ingredient, Receipt, ShoppingListItem, Tag
+from users.models import User
+
+
+class Command(SeedingCommand):
+    help = ('Замеряет редактирование рецепта с большим числом ингредиентов '
+            'и сравнивает его с пересозданием всех строк. Пишет в базу, '
+            'поэтому запускать на отдельной базе с --yes-seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=60)
+        parser.add_argument('--carts', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args: Any, **options: Any):
+        size = options['ingredients']
+        ingredient_ids = self.seed_ingredients(size + 5)
+        receipt = self.seed_receipt(options['carts'])
+        tags = list(Tag.objects.all()[:1])
+        base = [{'id': pk, 'amount': 100} for pk in ingredient_ids[:size]]
+        scenarios = {
+            'только текст': base,
+            '5 новых количеств': [
+                {'id': item['id'], 'amount': 200} if index < 5 else item
+                for index, item in enumerate(base)],
+            '5 замен': base[5:] + [
+                {'id': pk, 'amount': 100} for pk in ingredient_ids[size:]],
+        }
+        serializer = ReceiptCreateSerializer()
+        self.apply(serializer.update, receipt, base, tags)
+        for name, ingredients in scenarios.items():
+            for method, update in (('diff', serializer.update),
+                                   ('пересоздание', recreate)):
+                best, queries = None, 0
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    with CaptureQueriesContext(connection) as context:
+                        self.apply(update, receipt, ingredients, tags)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                    queries = len(context)
+                    self.apply(serializer.update, receipt, base, tags)
+                self.stdout.write(
+                    f'{name}, {method}: {best * 1000:.1f} мс, '
+                    f'{queries} запросов')
+
+    def apply(self, update, receipt, ingredients, tags):
+        update(receipt, {'ingredients': ingredients, 'tags': tags,
+                         'text': f'Описание {time.perf_counter()}'})
+
+    def seed_ingredients(self, total):
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'bench update {index}', measurement_unit='г')
+             for index in range(total)), ignore_conflicts=True)
+        return list(Ingredient.objects.filter(
+            name__startswith='bench update ').order_by('id').values_list(
+                'id', flat=True)[:total])
+
+    def seed_receipt(self, carts):
+        author, _ = User.objects.get_or_create(
+            username='bench', defaults={'email': 'bench@example.com'})
+        if not Tag.objects.exists():
+            Tag.objects.create(name='bench', color='#000000', slug='bench')
+        receipt, _ = Receipt.objects.get_or_create(
+            author=author, name='bench update', defaults={
+                'cooking_time': 10, 'text': 'Описание',
+                'image': 'images/recipes/bench.png'})
+        for index in range(carts):
+            user, _ = User.objects.get_or_create(
+                username=f'bench cart {index}',
+                defaults={'email': f'bench-cart-{index}@example.com'})
+            receipt.shopping_carts.get_or_create(user=user)
+        return receipt
+
+
+@transaction.atomic
+def recreate(instance, validated_data):
+    """Прежняя реализация ReceiptCreateSerializer.update."""
+    amounts = {
+        ingredient_id: -amount for ingredient_id, amount
+        in instance.receipt_ingredient.values_list('ingredient_id', 'amount')}
+    instance.ingredients.clear()
+    ingredients = validated_data.pop('ingredients')
+    ReceiptCreateSerializer().create_ingredients(ingredients, instance)
+    for ingredient in ingredients:
+        amounts[ingredient['id']] = (
+            amounts.get(ingredient['id'], 0) + ingredient['amount'])
+    ShoppingListItem.objects.change(
+        instance.shopping_carts.values_list('user_id', flat=True), amounts)
+    instance.tags.set(validated_data.pop('tags'))
+    for attr, value in validated_data.items():
+        setattr(instance, attr, value)
+    instance.save()
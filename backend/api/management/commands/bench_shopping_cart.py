@@ -0,0 +1,34 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from api.utils import SHOPPING_CART_EXPORTERS
+
+
+class Command(BaseCommand):
+    help = 'Замеряет скорость выгрузки списка покупок во всех форматах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+',
+                            default=[1000, 10000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args: Any, **options: Any):
+        for lines in options['lines']:
+            for file_format, (exporter, _) in SHOPPING_CART_EXPORTERS.items():
+                best, size = None, 0
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    size = sum(len(chunk) for chunk in exporter(
+                        synthetic_rows(lines)))
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write(
+                    f'{file_format}: {lines} строк, {best * 1000:.1f} мс, '
+                    f'{size} байт')
+
+
+def synthetic_rows(lines):
+    for index in range(lines):
+        yield f'Ингредиент {index}', index % 1000 + 1, 'г'
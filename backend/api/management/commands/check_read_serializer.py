@@ -0,0 +1,73 @@
+import random
+from typing import Any
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import ReceiptGetSerializer, ReceiptReadSerializer
+from recipes.models import Receipt
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Сверяет JSON рецептов от ReceiptReadSerializer и '
+            'ReceiptGetSerializer: в списке и при просмотре, для анонима и '
+            'нескольких пользователей. Данные создаёт seed_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=2000,
+                            help='Сколько рецептов проверить, 0 - все')
+        parser.add_argument('--users', type=int, default=3,
+                            help='Сколько пользователей взять кроме анонима')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args: Any, **options: Any):
+        recipe_ids = list(Receipt.objects.order_by('id').values_list(
+            'id', flat=True))
+        if options['recipes']:
+            recipe_ids = recipe_ids[:options['recipes']]
+        user_ids = list(User.objects.filter(
+            favorites__isnull=False, subscriber__isnull=False).distinct(
+                ).order_by('id').values_list('id', flat=True))
+        users = [AnonymousUser()] + list(User.objects.filter(
+            pk__in=random.Random(0).sample(
+                user_ids, min(options['users'], len(user_ids)))))
+        factory = APIRequestFactory()
+        render = JSONRenderer().render
+        mismatches = set()
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for user in users:
+                request = Request(factory.get('/api/recipes/'))
+                request.user = user
+                context = {'request': request}
+                for start in range(0, len(recipe_ids),
+                                   options['batch_size']):
+                    batch = list(Receipt.objects.for_representation(
+                        user).filter(pk__in=recipe_ids[
+                            start:start + options['batch_size']]))
+                    expected = ReceiptGetSerializer(
+                        batch, many=True, context=context).data
+                    actual = ReceiptReadSerializer(
+                        batch, many=True, context=context).data
+                    if render(expected) != render(actual):
+                        mismatches.update(
+                            recipe.pk for recipe, left, right in zip(
+                                batch, expected, actual)
+                            if render(left) != render(right))
+                    for recipe in batch:
+                        if render(ReceiptGetSerializer(
+                                recipe, context=context).data) != render(
+                                    ReceiptReadSerializer(
+                                        recipe, context=context).data):
+                            mismatches.add(recipe.pk)
+        self.stdout.write(
+            f'Проверено рецептов: {len(recipe_ids)}, пользователей: '
+            f'{len(users)}, расхождений: {len(mismatches)}')
+        if mismatches:
+            first = ', '.join(map(str, sorted(mismatches)[:20]))
+            raise CommandError('ReceiptReadSerializer расходится с '
+                               f'ReceiptGetSerializer для рецептов: {first}')
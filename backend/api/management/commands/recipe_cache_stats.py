@@ -0,0 +1,23 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from api.caching import get_cache_stats, reset_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша списка рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить счётчики после вывода')
+
+    def handle(self, *args: Any, **options: Any):
+        stats = get_cache_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(f"Попаданий: {stats['hits']}, "
+                          f"промахов: {stats['misses']}, "
+                          f'доля попаданий: {ratio:.1%}')
+        if options['reset']:
+            reset_cache_stats()
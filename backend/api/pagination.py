@@ -0,0 +1,128 @@
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+
+from recipes.models import TimelineEntry
+
+from .constants import MAX_PAGE_SIZE
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL без COUNT(*).
+
+    Для других СУБД возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class KeysetPagination(CursorPagination):
+    """Постраничный вывод по ключу id без OFFSET и COUNT(*).
+
+    Ответ того же вида, что и у PageLimitPagination; count - оценка
+    планировщика или null.
+    """
+    ordering = '-id'
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class PopularPagination(KeysetPagination):
+    """Постранично по месту в рейтинге популярности."""
+    ordering = 'popularity_position'
+
+
+class FeedPagination(KeysetPagination):
+    """Постранично по id рецепта для ленты подписок.
+
+    Страница собирается TimelineEntry.objects.feed_ids, из queryset
+    берутся только рецепты страницы; count всегда null.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        position, reverse = None, False
+        if cursor is not None:
+            reverse = cursor.reverse
+            try:
+                position = int(cursor.position)
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        ids = TimelineEntry.objects.feed_ids(
+            request.user, position, reverse, self.page_size + 1)
+        has_more = len(ids) > self.page_size
+        ids = ids[:self.page_size]
+        if reverse:
+            ids.reverse()
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        recipes = queryset.in_bulk(ids)
+        self.page = [recipes[pk] for pk in ids if pk in recipes]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.page[-1].pk))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.page[0].pk))
+
+
+class MatchPagination(PageNumberPagination):
+    """Номер страницы и limit для поиска рецептов по ингредиентам."""
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class PageLimitPagination(PageNumberPagination):
+    """Номер страницы и limit; с параметром cursor (можно пустым) -
+    постраничный вывод по ключу через KeysetPagination."""
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_pagination_class.cursor_query_param in (
+                request.query_params):
+            self.keyset = self.keyset_pagination_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,35 @@
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .renderers import FastJSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONParser(JSONParser):
+    """JSONParser на orjson, если он установлен.
+
+    Ошибочный JSON разбирает JSONParser, чтобы текст ошибки не менялся.
+    Отличие: целые больше 64 бит orjson читает как дробные, такие поля
+    всё равно не проходят проверку сериализаторов.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None or not self.strict:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding',
+                                              settings.DEFAULT_CHARSET)
+        content = stream.read()
+        try:
+            return orjson.loads(
+                content if encoding.lower() in ('utf-8', 'utf8')
+                else content.decode(encoding))
+        except (orjson.JSONDecodeError, UnicodeDecodeError):
+            return super().parse(io.BytesIO(content), media_type,
+                                 parser_context)
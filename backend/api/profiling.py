@@ -0,0 +1,184 @@
+import heapq
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+from itertools import chain
+from threading import Lock
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+from .constants import (PROFILING_REPEAT_THRESHOLD, PROFILING_SLOW_QUERIES,
+                        PROFILING_SQL_LENGTH)
+
+logger = logging.getLogger(__name__)
+
+
+def endpoint_name(request, view_func):
+    """ReceiptViewSet.list для DRF, модуль и имя функции для остальных."""
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class RequestProfile:
+    """Запросы к базе и время одного HTTP-запроса.
+
+    Экземпляр - обёртка execute_wrapper: замеряет каждый запрос.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_finished = None
+        self.endpoint = None
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, sql, params))
+
+    def finish(self):
+        finished = time.perf_counter()
+        self.total = finished - self.started
+        self.db = sum(duration for duration, _, _ in self.queries)
+        # Ответы DRF рендерятся после выхода из view: это время
+        # преобразования данных в JSON.
+        self.render = (finished - self.view_finished
+                       if self.view_finished is not None else 0)
+        self.app = max(self.total - self.db - self.render, 0)
+        # Один и тот же SQL с разными параметрами - признак N+1,
+        # с одинаковыми - лишний повторный запрос.
+        self.repeated = Counter(sql for _, sql, _ in self.queries)
+        self.duplicates = sum(
+            count - 1 for count in Counter(
+                (sql, repr(params)) for _, sql, params in self.queries
+            ).values())
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;dur={self.db * 1000:.1f};desc="{len(self.queries)} '
+            f'queries, {self.duplicates} duplicates"',
+            f'app;dur={self.app * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+class ProfileStats:
+    """Сводка профилей запросов по view в памяти процесса."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.since = timezone.now()
+            self.endpoints = {}
+
+    def add(self, profile):
+        with self.lock:
+            stats = self.endpoints.setdefault(profile.endpoint, {
+                'requests': 0, 'queries': 0, 'max_queries': 0,
+                'duplicates': 0, 'db': 0, 'app': 0, 'render': 0,
+                'total': 0, 'max_total': 0, 'repeated': {}, 'slowest': [],
+            })
+            stats['requests'] += 1
+            stats['queries'] += len(profile.queries)
+            stats['max_queries'] = max(stats['max_queries'],
+                                       len(profile.queries))
+            stats['duplicates'] += profile.duplicates
+            for name in ('db', 'app', 'render', 'total'):
+                stats[name] += getattr(profile, name)
+            stats['max_total'] = max(stats['max_total'], profile.total)
+            for sql, count in profile.repeated.items():
+                if (count >= PROFILING_REPEAT_THRESHOLD
+                        and count > stats['repeated'].get(sql, 0)):
+                    stats['repeated'][sql] = count
+            stats['slowest'] = heapq.nlargest(
+                PROFILING_SLOW_QUERIES, chain(
+                    stats['slowest'],
+                    ((duration, sql) for duration, sql, _ in profile.queries)),
+                key=lambda query: query[0])
+
+    def report(self):
+        with self.lock:
+            endpoints = sorted(self.endpoints.items(),
+                               key=lambda item: item[1]['total'],
+                               reverse=True)
+            return {
+                'enabled': settings.REQUEST_PROFILING,
+                'since': self.since,
+                'endpoints': [{
+                    'endpoint': endpoint,
+                    'requests': stats['requests'],
+                    'avg_queries': round(
+                        stats['queries'] / stats['requests'], 1),
+                    'max_queries': stats['max_queries'],
+                    'duplicates': stats['duplicates'],
+                    **{f'avg_{name}_ms': round(
+                        stats[name] / stats['requests'] * 1000, 1)
+                       for name in ('db', 'app', 'render', 'total')},
+                    'max_total_ms': round(stats['max_total'] * 1000, 1),
+                    'repeated_queries': [
+                        {'sql': sql[:PROFILING_SQL_LENGTH], 'count': count}
+                        for sql, count in sorted(
+                            stats['repeated'].items(),
+                            key=lambda item: item[1], reverse=True)],
+                    'slowest_queries': [
+                        {'sql': sql[:PROFILING_SQL_LENGTH],
+                         'ms': round(duration * 1000, 1)}
+                        for duration, sql in stats['slowest']],
+                } for endpoint, stats in endpoints],
+            }
+
+
+profile_stats = ProfileStats()
+
+
+class ProfilingMiddleware:
+    """Считает запросы к базе и время по частям для каждого запроса,
+    добавляет заголовок Server-Timing и копит сводку в profile_stats.
+
+    Включается настройкой REQUEST_PROFILING; без неё Django исключает
+    middleware из цепочки при старте.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = request._profile = RequestProfile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            response = self.get_response(request)
+        profile.finish()
+        response['Server-Timing'] = profile.server_timing()
+        if profile.endpoint is not None:
+            profile_stats.add(profile)
+            sql, count = max(profile.repeated.items(),
+                             key=lambda item: item[1], default=('', 0))
+            if count >= PROFILING_REPEAT_THRESHOLD:
+                logger.warning('%s: %d однотипных запросов к базе: %s',
+                               profile.endpoint, count,
+                               sql[:PROFILING_SQL_LENGTH])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._profile.endpoint = endpoint_name(request, view_func)
+
+    def process_template_response(self, request, response):
+        request._profile.view_finished = time.perf_counter()
+        return response
@@ -0,0 +1,261 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+from datetime import timedelta
+from threading import Lock
+
+from django.utils import timezone
+
+from recipes.constants import DELETED_RECIPES_KEEP_DAYS
+from recipes.models import (DeletedRecipe, Receipt, ReceiptIngredient,
+                            TableVersion)
+
+# Транзакция может закоммитить рецепт позже, чем проставила updated_at,
+# поэтому синхронизация с запасом перечитывает недавние рецепты.
+SYNC_OVERLAP = timedelta(minutes=1)
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(bits):
+        return bin(bits).count('1')
+
+
+def bitmap_from_ids(ids, size):
+    buffer = bytearray(size // 8 + 1)
+    for recipe_id in ids:
+        buffer[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def ids_from_bitmap(bits, skip, limit):
+    """id из битовой карты по убыванию: сначала новые рецепты."""
+    ids = []
+    while bits and len(ids) < limit:
+        recipe_id = bits.bit_length() - 1
+        bits ^= 1 << recipe_id
+        if skip:
+            skip -= 1
+        else:
+            ids.append(recipe_id)
+    return ids
+
+
+def compact(recipe_ids, size):
+    # Массив занимает 4 байта на рецепт, битовая карта - бит на каждый
+    # возможный id.
+    if len(recipe_ids) * 32 < size:
+        return array('I', recipe_ids)
+    return bitmap_from_ids(recipe_ids, size)
+
+
+def add(postings, totals, recipe_id, ingredient_ids):
+    bit = 1 << recipe_id
+    total = len(ingredient_ids)
+    totals[total] = totals.get(total, 0) | bit
+    for ingredient_id in ingredient_ids:
+        posting = postings.get(ingredient_id, array('I'))
+        if isinstance(posting, array):
+            posting = array('I', posting)
+            insort(posting, recipe_id)
+        else:
+            posting |= bit
+        postings[ingredient_id] = posting
+
+
+def remove(postings, totals, recipe_id):
+    bit = 1 << recipe_id
+    for total, bits in totals.items():
+        if bits & bit:
+            totals[total] = bits ^ bit
+            break
+    else:
+        return
+    for ingredient_id, posting in postings.items():
+        if isinstance(posting, array):
+            index = bisect_left(posting, recipe_id)
+            if index < len(posting) and posting[index] == recipe_id:
+                postings[ingredient_id] = posting[:index] + posting[
+                    index + 1:]
+        elif posting & bit:
+            postings[ingredient_id] = posting ^ bit
+
+
+class RecipeMatchIndex:
+    """Обратный индекс «ингредиент -> рецепты» в памяти процесса.
+
+    Номер бита - id рецепта. Частые ингредиенты хранятся битовыми
+    картами (int), редкие - отсортированными массивами id, смотря что
+    компактнее. Для каждого числа ингредиентов в рецепте хранится карта
+    рецептов с таким числом. Запрос складывает карты выбранных
+    ингредиентов побитово, получая для каждого рецепта число совпадений,
+    и выдаёт рецепты по убыванию доли совпавших ингредиентов.
+
+    Индекс догоняет базу по версии таблицы receipt: перечитываются
+    рецепты с новым updated_at и выбрасываются записанные в DeletedRecipe.
+    Рецепт, удалённый без сигналов, выбрасывает выборка страницы, не
+    найдя его. Индекс, не синхронизированный дольше, чем хранятся записи
+    об удалении, строится заново.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.built = False
+        self.version = None
+        self.synced_at = None
+        # (размер, postings, totals) заменяются одним присваиванием:
+        # поиск читает их без блокировки и видит либо старый индекс, либо
+        # новый. Изменения идут в копии словарей, массивы id на месте не
+        # меняются.
+        self.state = (0, {}, {})
+
+    def build(self, version):
+        synced_at = timezone.now()
+        recipes = defaultdict(list)
+        for recipe_id, ingredient_id in ReceiptIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id').order_by().iterator():
+            recipes[recipe_id].append(ingredient_id)
+        size = max(recipes, default=0) + 1
+        postings, totals = defaultdict(list), defaultdict(list)
+        for recipe_id, ingredient_ids in recipes.items():
+            totals[len(ingredient_ids)].append(recipe_id)
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id].append(recipe_id)
+        self.state = (size, {
+            ingredient_id: compact(sorted(recipe_ids), size)
+            for ingredient_id, recipe_ids in postings.items()}, {
+            total: bitmap_from_ids(recipe_ids, size)
+            for total, recipe_ids in totals.items()})
+        self.version, self.synced_at, self.built = version, synced_at, True
+
+    def sync(self, version):
+        synced_at = timezone.now()
+        changed = defaultdict(list)
+        for recipe_id, ingredient_id in ReceiptIngredient.objects.filter(
+                recipe__updated_at__gte=self.synced_at - SYNC_OVERLAP
+        ).values_list('recipe_id', 'ingredient_id').order_by():
+            changed[recipe_id].append(ingredient_id)
+        changed.update(
+            (recipe_id, []) for recipe_id in Receipt.objects.filter(
+                updated_at__gte=self.synced_at - SYNC_OVERLAP).exclude(
+                    pk__in=list(changed)).values_list('id', flat=True))
+        self.update(changed, DeletedRecipe.objects.filter(
+            deleted_at__gte=self.synced_at - SYNC_OVERLAP).values_list(
+                'recipe_id', flat=True))
+        self.version, self.synced_at = version, synced_at
+
+    def update(self, changed, deleted=()):
+        """Перечитанные рецепты {id: [id ингредиентов]} и удалённые id.
+
+        Вызывается под self.lock.
+        """
+        size, postings, totals = self.state
+        postings, totals = dict(postings), dict(totals)
+        for recipe_id in [*changed, *deleted]:
+            remove(postings, totals, recipe_id)
+        for recipe_id, ingredient_ids in changed.items():
+            if ingredient_ids:
+                size = max(size, recipe_id + 1)
+                add(postings, totals, recipe_id, ingredient_ids)
+        self.state = (size, postings, totals)
+
+    def refresh(self):
+        version = TableVersion.objects.get_versions(['receipt'])['receipt'][0]
+        if not self.built or version != self.version:
+            with self.lock:
+                if not self.built or self.synced_at < timezone.now() - (
+                        timedelta(days=DELETED_RECIPES_KEEP_DAYS)):
+                    self.build(version)
+                elif version != self.version:
+                    self.sync(version)
+
+    def search(self, ingredient_ids):
+        """Группы совпавших рецептов от лучших к худшим.
+
+        Каждая группа - (совпало, всего ингредиентов, битовая карта).
+        """
+        self.refresh()
+        size, postings, totals = self.state
+        # planes[j] - j-й бит числа совпадений каждого рецепта.
+        planes = []
+        for ingredient_id in set(ingredient_ids):
+            carry = postings.get(ingredient_id, 0)
+            if isinstance(carry, array):
+                carry = bitmap_from_ids(carry, size)
+            for index, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[index], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+        if not planes:
+            return []
+        everything = (1 << size) - 1
+        groups = []
+        for matched in range(1, 1 << len(planes)):
+            bits = everything
+            for index, plane in enumerate(planes):
+                bits &= plane if matched >> index & 1 else everything ^ plane
+            if not bits:
+                continue
+            for total, recipes in totals.items():
+                if total >= matched and bits & recipes:
+                    groups.append((matched, total, bits & recipes))
+        groups.sort(key=lambda group: (-group[0] / group[1], -group[0]))
+        return groups
+
+
+class RecipeMatches:
+    """Результат поиска по ингредиентам как последовательность рецептов
+    для пагинатора: длина - число найденных рецептов, срез выбирает из
+    базы только рецепты страницы."""
+
+    def __init__(self, index, queryset, ingredient_ids):
+        self.index = index
+        self.queryset = queryset
+        self.ingredient_ids = ingredient_ids
+        self.groups = index.search(ingredient_ids)
+        self.count = None
+
+    def __len__(self):
+        if self.count is None:
+            self.count = sum(popcount(bits) for _, _, bits in self.groups)
+        return self.count
+
+    def __getitem__(self, page):
+        while True:
+            ids, matches = self.page_ids(page.start or 0,
+                                         page.stop - (page.start or 0))
+            recipes = self.queryset.in_bulk(ids)
+            deleted = [recipe_id for recipe_id in ids
+                       if recipe_id not in recipes]
+            if not deleted:
+                break
+            with self.index.lock:
+                self.index.update({}, deleted)
+            self.groups = self.index.search(self.ingredient_ids)
+            self.count = None
+        for recipe_id in ids:
+            recipes[recipe_id].matched, recipes[recipe_id].total = (
+                matches[recipe_id])
+        return [recipes[recipe_id] for recipe_id in ids]
+
+    def page_ids(self, skip, limit):
+        ids, matches = [], {}
+        for matched, total, bits in self.groups:
+            if len(ids) >= limit:
+                break
+            if skip:
+                size = popcount(bits)
+                if skip >= size:
+                    skip -= size
+                    continue
+            page = ids_from_bitmap(bits, skip, limit - len(ids))
+            skip = 0
+            ids.extend(page)
+            matches.update((recipe_id, (matched, total))
+                           for recipe_id in page)
+        return ids, matches
+
+
+recipe_match_index = RecipeMatchIndex()
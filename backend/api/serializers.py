@@ -1,14 +1,19 @@
 import base64
+import binascii
 
-from django.shortcuts import get_object_or_404
 from django.contrib.auth.hashers import check_password
-from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from recipes.models import (Favorite, Ingredient, Receipt, ReceiptIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag)
 from users.models import User, Subscribe
-from .constants import MAX_PASSWORD_LENGTH
+from .constants import (BASE64_CHUNK_SIZE, IMAGE_FORMATS, IMAGE_VARIANT_FORMAT,
+                        MAX_IMAGE_SIZE, MAX_PASSWORD_LENGTH)
+from .utils import get_recipes_limit
 from recipes.constants import (MAX_COOKING_TIME, MIN_COOKING_TIME,
                                MIN_AMOUNT, MAX_AMOUNT)
 
@@ -22,6 +27,8 @@ class UserSerializer(serializers.ModelSerializer):
                   'first_name', 'last_name', 'is_subscribed']
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and request.user.subscriber.filter(author=obj).exists())
@@ -76,8 +83,38 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'measurement_unit', 'amount']
 
 
+def media_url(name, context):
+    url = default_storage.url(name)
+    request = context.get('request')
+    return request.build_absolute_uri(url) if request else url
+
+
+class ImageVariantField(serializers.Field):
+    """URL уменьшенной копии картинки рецепта, пока её нет - оригинала.
+
+    Без size берётся карточка для списков и детальный размер для
+    одного рецепта.
+    """
+
+    def __init__(self, size=None, **kwargs):
+        self.size = size
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, receipt):
+        if not receipt.image:
+            return None
+        in_list = isinstance(self.parent.parent, serializers.ListSerializer)
+        size = self.size or ('card' if in_list else 'detail')
+        variant = (receipt.image_variants or {}).get(size, {})
+        return media_url(variant.get(IMAGE_VARIANT_FORMAT, receipt.image.name),
+                         self.context)
+
+
 class ReceiptGetSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True)
+    image = ImageVariantField()
+    image_variants = serializers.SerializerMethodField()
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
         source='receipt_ingredient', many=True)
@@ -87,25 +124,119 @@ class ReceiptGetSerializer(serializers.ModelSerializer):
     class Meta:
         model = Receipt
         fields = ['id', 'name', 'ingredients', 'tags',
-                  'image', 'text', 'cooking_time', 'author',
+                  'image', 'image_variants', 'text', 'cooking_time', 'author',
                   'is_favorited', 'is_in_shopping_cart']
 
+    def get_image_variants(self, obj):
+        if not obj.image_variants or 'error' in obj.image_variants:
+            return {}
+        return {size: {file_format: media_url(name, self.context)
+                       for file_format, name in files.items()}
+                for size, files in obj.image_variants.items()}
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and request.user.favorites.filter(recipe=obj).exists())
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (request and request.user.is_authenticated
                 and request.user.shopping_carts.filter(recipe=obj).exists())
 
 
+class ReceiptReadSerializer(ReceiptGetSerializer):
+    """ReceiptGetSerializer без обхода полей DRF для списков и просмотра
+    рецептов: словарь собирается напрямую из объектов for_representation.
+
+    Вывод должен совпадать с ReceiptGetSerializer до байта, это
+    проверяют ReadSerializerParityTest и, на данных seed_data, команда
+    check_read_serializer.
+    """
+
+    def to_representation(self, instance):
+        fields = self.fields
+        author = instance.author
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'ingredients': [{
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            } for item in instance.receipt_ingredient.all()],
+            'tags': [{
+                'id': tag.id,
+                'name': tag.name,
+                'color': tag.color,
+                'slug': tag.slug,
+            } for tag in instance.tags.all()],
+            'image': fields['image'].to_representation(instance),
+            'image_variants': self.get_image_variants(instance),
+            'text': instance.text,
+            'cooking_time': instance.cooking_time,
+            'author': {
+                'email': author.email,
+                'id': author.id,
+                'username': author.username,
+                'first_name': author.first_name,
+                'last_name': author.last_name,
+                'is_subscribed': fields['author'].get_is_subscribed(author),
+            },
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+        }
+
+
+class ReceiptMatchSerializer(ReceiptGetSerializer):
+    matched_ingredients = serializers.IntegerField(source='matched')
+    total_ingredients = serializers.IntegerField(source='total')
+
+    class Meta(ReceiptGetSerializer.Meta):
+        fields = ReceiptGetSerializer.Meta.fields + [
+            'matched_ingredients', 'total_ingredients']
+
+
 class Base64EncodedImageField(serializers.ImageField):
+    """Картинка в data URL. Декодируется частями во временный файл на
+    диске, затем проверяется Pillow."""
+
+    default_error_messages = {
+        'invalid_data_url': 'Ожидалась картинка в формате data URL '
+                            '(data:image/<формат>;base64,...).',
+        'too_large': 'Картинка больше {max_size} МБ.',
+    }
+
     def to_internal_value(self, data):
-        format, imgstr = data.split(';base64,')
-        ext = format.split('/')[-1]
-        return ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+        if not isinstance(data, str) or ';base64,' not in data:
+            self.fail('invalid_data_url')
+        header, encoded = data.split(';base64,', 1)
+        ext = header.rpartition('/')[2].lower()
+        if not header.startswith('data:image/') or ext not in IMAGE_FORMATS:
+            self.fail('invalid_data_url')
+        if len(encoded) // 4 * 3 > MAX_IMAGE_SIZE:
+            self.fail('too_large', max_size=MAX_IMAGE_SIZE // (1024 * 1024))
+        upload = TemporaryUploadedFile(
+            f'temp.{ext}', f'image/{ext}', 0, None)
+        try:
+            for start in range(0, len(encoded), BASE64_CHUNK_SIZE):
+                upload.write(base64.b64decode(
+                    encoded[start:start + BASE64_CHUNK_SIZE], validate=True))
+        except binascii.Error:
+            upload.close()
+            self.fail('invalid_data_url')
+        upload.size = upload.tell()
+        upload.seek(0)
+        try:
+            return super().to_internal_value(upload)
+        except serializers.ValidationError:
+            upload.close()
+            raise
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -115,16 +246,36 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
         model = ReceiptIngredient
         fields = ['id', 'amount']
 
-    def validate_id(self, id):
-        if not Ingredient.objects.filter(id=id).exists():
-            raise serializers.ValidationError(
-                'Такого ингредиента не существует!')
-        return id
+
+class PrimaryKeyListField(serializers.ListField):
+    """Список первичных ключей, который загружает объекты одним in_bulk
+    и сообщает сразу обо всех несуществующих ключах."""
+
+    child = serializers.IntegerField()
+    default_error_messages = {
+        'does_not_exist': serializers.PrimaryKeyRelatedField
+        .default_error_messages['does_not_exist'],
+    }
+
+    def __init__(self, queryset, **kwargs):
+        self.queryset = queryset
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = self.queryset.in_bulk(pks)
+        missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+        if missing:
+            raise serializers.ValidationError([
+                self.error_messages['does_not_exist'].format(pk_value=pk)
+                for pk in missing], code='does_not_exist')
+        return [objects[pk] for pk in pks]
 
 
 class ReceiptCreateSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientCreateSerializer(many=True)
+    tags = PrimaryKeyListField(queryset=Tag.objects.all())
     image = Base64EncodedImageField()
 
     class Meta:
@@ -153,7 +304,6 @@ class ReceiptCreateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     'Ингредиенты не должны повторяться')
             ingredient_ids.add(ingredient_id)
-            get_object_or_404(Ingredient, id=ingredient_id)
             amount = ingredient['amount']
             if not isinstance(amount, int):
                 raise serializers.ValidationError(
@@ -161,6 +311,13 @@ class ReceiptCreateSerializer(serializers.ModelSerializer):
             if amount < MIN_AMOUNT or amount > MAX_AMOUNT:
                 raise serializers.ValidationError(
                     'Количество ингредиента должно быть в диапазоне 1-10000')
+        existing = set(Ingredient.objects.filter(
+            id__in=ingredient_ids).values_list('id', flat=True))
+        if len(existing) < len(ingredient_ids):
+            raise serializers.ValidationError([
+                {} if ingredient['id'] in existing
+                else {'id': ['Такого ингредиента не существует!']}
+                for ingredient in ingredients])
         return ingredients
 
     def validate_tags(self, tags):
@@ -173,7 +330,6 @@ class ReceiptCreateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     'Тэги не должны повторяться')
             tag_ids.add(tag.id)
-            get_object_or_404(Tag, id=tag.id)
         return tags
 
     def create_ingredients(self, ingredients, receipt):
@@ -194,20 +350,60 @@ class ReceiptCreateSerializer(serializers.ModelSerializer):
         receipt.tags.set(tags)
         return receipt
 
+    def update_ingredients(self, ingredients, receipt):
+        """Приводит ингредиенты рецепта к ingredients, трогая только
+        изменившиеся строки. Возвращает изменения количеств
+        {ingredient_id: разница} у добавленных и изменённых строк."""
+        current = {item.ingredient_id: item
+                   for item in receipt.receipt_ingredient.all()}
+        amounts, changed, created = {}, [], []
+        for ingredient in ingredients:
+            item = current.pop(ingredient['id'], None)
+            if item is None:
+                created.append(ingredient)
+                amounts[ingredient['id']] = ingredient['amount']
+            elif item.amount != ingredient['amount']:
+                amounts[ingredient['id']] = ingredient['amount'] - item.amount
+                item.amount = ingredient['amount']
+                changed.append(item)
+        if current:
+            # Удалённые строки вычитают из списков покупок сигналы.
+            ReceiptIngredient.objects.filter(
+                pk__in=[item.pk for item in current.values()]).delete()
+        ReceiptIngredient.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(created, receipt)
+        return amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        instance.ingredients.clear()
-        self.create_ingredients(
-            validated_data.pop('ingredients'), instance
-        )
+        amounts = self.update_ingredients(
+            validated_data.pop('ingredients'), instance)
+        ShoppingListItem.objects.change(
+            instance.shopping_carts.values_list('user_id', flat=True),
+            amounts)
         instance.tags.set(
             validated_data.pop('tags'))
+        if 'image' in validated_data:
+            validated_data['image_variants'] = None
         return super().update(instance, validated_data)
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Хранилище забирает временный файл себе, закрыть его нужно
+            # явно, как это делает Django для обычных загрузок.
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def to_representation(self, instance):
         return ReceiptGetSerializer(instance, context=self.context).data
 
 
 class ReceiptRepresantaionSerializer(serializers.ModelSerializer):
+    image = ImageVariantField('card')
+
     class Meta:
         model = Receipt
         fields = ['id', 'name', 'image', 'cooking_time']
@@ -221,11 +417,7 @@ class UserSubscriptionSerializer(UserSerializer):
         fields = UserSerializer.Meta.fields + ['recipes', 'recipes_count']
 
     def get_recipes(self, obj):
-        limit = self.context['request'].query_params.get('recipes_limit')
-        try:
-            limit = int(limit)
-        except (TypeError, ValueError):
-            limit = None
+        limit = get_recipes_limit(self.context['request'])
         return ReceiptRepresantaionSerializer(
             obj.recipes.all()[:limit], many=True).data
 
@@ -249,35 +441,44 @@ class SubscribeSerializer(serializers.ModelSerializer):
                                           context=self.context).data
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class RecipeRelationSerializer(serializers.ModelSerializer):
+    """Связь пользователя с рецептом. Повторное добавление отсекает
+    уникальное ограничение модели, без запроса-проверки."""
+
+    duplicate_message = None
+
     class Meta:
-        model = Favorite
         fields = ['user', 'recipe']
 
-    def validate(self, data):
-        user = data.get('user')
-        recipe = data.get('recipe')
-
-        if recipe.favorites.filter(user=user).exists():
-            raise serializers.ValidationError('Уже добавлено в избранное.')
-        return data
+    def create(self, validated_data):
+        try:
+            # Точка сохранения: ошибка вставки не должна обрывать
+            # внешнюю транзакцию.
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            # Другие нарушения, например рецепт удалён параллельно,
+            # не выдаются за повторное добавление.
+            if not self.Meta.model.objects.filter(
+                    user=validated_data['user'],
+                    recipe=validated_data['recipe']).exists():
+                raise
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [self.duplicate_message]})
 
     def to_representation(self, instance):
         return ReceiptRepresantaionSerializer(instance.recipe).data
 
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = ShoppingCart
-        fields = ['user', 'recipe']
+class FavoriteSerializer(RecipeRelationSerializer):
+    duplicate_message = 'Уже добавлено в избранное.'
 
-    def validate(self, data):
-        user = data.get('user')
-        recipe = data.get('recipe')
+    class Meta(RecipeRelationSerializer.Meta):
+        model = Favorite
 
-        if recipe.shopping_carts.filter(user=user).exists():
-            raise serializers.ValidationError('Уже добавлено в покупках.')
-        return data
 
-    def to_representation(self, instance):
-        return ReceiptRepresantaionSerializer(instance.recipe).data
+class ShoppingCartSerializer(RecipeRelationSerializer):
+    duplicate_message = 'Уже добавлено в покупках.'
+
+    class Meta(RecipeRelationSerializer.Meta):
+        model = ShoppingCart
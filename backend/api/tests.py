@@ -0,0 +1,173 @@
+from unittest import skipUnless
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from recipes.models import (Favorite, Ingredient, Receipt, ReceiptIngredient,
+                            ShoppingCart, Tag)
+from users.models import Subscribe, User
+from .serializers import (ReceiptGetSerializer, ReceiptReadSerializer,
+                          RecipeIngredientSerializer, TagSerializer,
+                          UserSerializer)
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader', password='x')
+        author = User.objects.create_user(
+            email='author@example.com', username='author', password='x')
+        Subscribe.objects.create(user=cls.user, author=author)
+        tags = [Tag.objects.create(name=f'Тег {index}', slug=f'tag-{index}')
+                for index in range(2)]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(3)]
+        for index in range(10):
+            recipe = Receipt.objects.create(
+                author=author if index % 2 else cls.user,
+                name=f'Рецепт {index}', text='Описание', cooking_time=10,
+                image='images/recipes/test.png')
+            recipe.tags.set(tags)
+            for ingredient in ingredients:
+                ReceiptIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1)
+            if index % 3 == 0:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        # Анонимные страницы кэшируются, замер нужен без кэша.
+        caches['recipes'].clear()
+
+    def assert_queries(self, client, expected):
+        for limit in (2, 10):
+            with self.subTest(limit=limit), self.assertNumQueries(expected):
+                response = client.get('/api/recipes/', {'limit': limit})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_queries(APIClient(), 6)
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assert_queries(client, 6)
+
+
+class ReadSerializerParityTest(TestCase):
+    """ReceiptReadSerializer отдаёт тот же JSON, что ReceiptGetSerializer."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader', password='x')
+        author = User.objects.create_user(
+            email='author@example.com', username='author', password='x',
+            first_name='Имя', last_name='Фамилия')
+        Subscribe.objects.create(user=cls.user, author=author)
+        tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        ingredient = Ingredient.objects.create(name='Мука',
+                                               measurement_unit='г')
+        variants = {size: {'webp': f'images/recipes/variants/{size}.webp',
+                           'avif': f'images/recipes/variants/{size}.avif'}
+                    for size in ('card', 'detail', 'retina')}
+        for index, (image, image_variants) in enumerate((
+                ('images/recipes/a.png', variants),
+                ('images/recipes/b.png', {'card': variants['card']}),
+                ('images/recipes/c.png', {'error': 'cannot identify image'}),
+                ('images/recipes/d.png', None),
+                ('', None))):
+            recipe = Receipt.objects.create(
+                author=author if index % 2 else cls.user,
+                name=f'Рецепт {index}', text='Описание',
+                cooking_time=index + 1, image=image,
+                image_variants=image_variants)
+            if index != 1:
+                recipe.tags.add(tag)
+                ReceiptIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1)
+            if index % 2 == 0:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if index % 3 == 0:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def render(self, serializer_class, recipes, user, many):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        return JSONRenderer().render(serializer_class(
+            recipes, many=many, context={'request': request}).data)
+
+    def test_same_json(self):
+        for user in (AnonymousUser(), self.user):
+            recipes = list(Receipt.objects.for_representation(user))
+            with self.subTest(user=user, many=True):
+                self.assertEqual(
+                    self.render(ReceiptReadSerializer, recipes, user, True),
+                    self.render(ReceiptGetSerializer, recipes, user, True))
+            for recipe in recipes:
+                with self.subTest(user=user, recipe=recipe.name):
+                    self.assertEqual(
+                        self.render(ReceiptReadSerializer, recipe, user,
+                                    False),
+                        self.render(ReceiptGetSerializer, recipe, user,
+                                    False))
+
+    def test_same_fields(self):
+        # Поля в to_representation перечислены вручную и должны
+        # следовать за Meta.fields сериализаторов.
+        recipe = Receipt.objects.for_representation(self.user).first()
+        data = ReceiptReadSerializer(recipe).data
+        self.assertEqual(list(data), ReceiptGetSerializer.Meta.fields)
+        self.assertEqual(list(data['author']), UserSerializer.Meta.fields)
+        self.assertEqual(list(data['tags'][0]), TagSerializer.Meta.fields)
+        self.assertEqual(list(data['ingredients'][0]),
+                         RecipeIngredientSerializer.Meta.fields)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Поиск для PostgreSQL')
+class RecipeSearchTest(TestCase):
+    """Полнотекстовый и триграммный поиск по индексам миграции 0013."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author', password='x')
+        for name, text in (('Борщ украинский', 'Свёкла, капуста, сметана'),
+                           ('Щи', 'Капуста квашеная'),
+                           ('Сырники', 'Творог и мука')):
+            Receipt.objects.create(author=author, name=name, text=text,
+                                   cooking_time=30,
+                                   image='images/recipes/test.png')
+
+    def search(self, query):
+        response = APIClient().get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_word_forms(self):
+        self.assertEqual(self.search('борща'), ['Борщ украинский'])
+        self.assertEqual(self.search('капусту'), ['Щи', 'Борщ украинский'])
+
+    def test_name_substring(self):
+        self.assertEqual(self.search('рник'), ['Сырники'])
+
+    def test_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT indexname FROM pg_indexes WHERE indexname IN '
+                "('receipt_search_vector', 'receipt_name_trgm', "
+                "'ingredient_name_trgm')")
+            self.assertEqual(len(cursor.fetchall()), 3)
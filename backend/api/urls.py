@@ -2,7 +2,8 @@ from django.urls import include, path
 from djoser.views import TokenCreateView, TokenDestroyView
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientViewSet, ReceiptViewSet, TagViewSet, UserViewSet
+from .views import (IngredientViewSet, ProfilingView, ReceiptViewSet,
+                    TagViewSet, UserViewSet)
 
 router = DefaultRouter()
 router.register('users', UserViewSet, basename='users')
@@ -15,4 +16,5 @@ urlpatterns = [
     path('', include(router.urls)),
     path('auth/token/login/', TokenCreateView.as_view(), name='login'),
     path('auth/token/logout/', TokenDestroyView.as_view(), name='logout'),
+    path('profiling/', ProfilingView.as_view(), name='profiling'),
 ]
@@ -1,21 +1,389 @@
-def forming_shopping_cart_file(recipes):
-    ingredients = {}
-    for recipe in recipes:
-        for receipt_ingredient in recipe.receipt_ingredient.all():
-            name = receipt_ingredient.ingredient.name
-            amount = receipt_ingredient.amount
-            measurement_unit = receipt_ingredient.ingredient.measurement_unit
-            if name in ingredients:
-                ingredients[name]['amount'] += amount
-            else:
-                ingredients[name] = {
-                    'amount': amount,
-                    'measurement_unit': measurement_unit
-                }
-
-    file_content = ''
-    for name, details in ingredients.items():
-        file_content += (
-            f"{name}: {details['amount']} {details['measurement_unit']}\n")
-
-    return file_content
+import csv
+import logging
+import struct
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from rest_framework.negotiation import BaseContentNegotiation
+
+from recipes.models import ShoppingListItem
+from .constants import (PDF_FONT_SIZE, PDF_LEADING, PDF_LINES_PER_PAGE,
+                        PDF_MARGIN, PDF_PAGE_HEIGHT, PDF_PAGE_WIDTH)
+
+logger = logging.getLogger(__name__)
+
+SHOPPING_CART_EXPORTERS = {}
+
+# Флаги составного глифа TrueType: есть ещё компоненты, аргументы -
+# слова, и размеры трёх вариантов масштаба.
+COMPOSITE_MORE = 0x20
+COMPOSITE_WORDS = 0x01
+COMPOSITE_TRANSFORMS = ((0x08, 2), (0x40, 4), (0x80, 8))
+# Таблицы шрифта, которые нужны PDF для отрисовки глифов.
+PDF_FONT_TABLES = (b'head', b'hhea', b'hmtx', b'maxp', b'loca', b'glyf',
+                   b'cvt ', b'fpgm', b'prep')
+
+
+class IgnoreClientContentNegotiation(BaseContentNegotiation):
+    """Не даёт DRF трактовать ?format= как выбор рендерера."""
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def get_recipes_limit(request):
+    try:
+        limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return limit if limit >= 0 else None
+
+
+def shopping_cart_rows(user):
+    return ShoppingListItem.objects.filter(user=user).order_by(
+        'ingredient__name').values_list(
+            'ingredient__name', 'amount',
+            'ingredient__measurement_unit').iterator()
+
+
+class ExportUnavailable(Exception):
+    """Формат выгрузки не работает из-за настройки сервера."""
+
+
+def shopping_cart_exporter(format, content_type):
+    def register(func):
+        SHOPPING_CART_EXPORTERS[format] = (func, content_type)
+        return func
+    return register
+
+
+@shopping_cart_exporter('txt', 'text/plain; charset=utf-8')
+def forming_shopping_cart_file(rows):
+    for name, amount, measurement_unit in rows:
+        yield f'{name}: {amount} {measurement_unit}\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+@shopping_cart_exporter('csv', 'text/csv; charset=utf-8')
+def forming_shopping_cart_csv(rows):
+    writer = csv.writer(Echo())
+    yield '\ufeff' + writer.writerow(
+        ['Ингредиент', 'Количество', 'Единица измерения'])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class PdfFont:
+    """TrueType-шрифт для встраивания в PDF (нужен для кириллицы)."""
+
+    def __init__(self, path):
+        self.name = ''.join(char for char in Path(path).stem
+                            if char.isalnum()).encode()
+        with open(path, 'rb') as font_file:
+            self.data = font_file.read()
+        self.tables = {}
+        num_tables, = struct.unpack_from('>H', self.data, 4)
+        for index in range(num_tables):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', self.data, 12 + 16 * index)
+            self.tables[tag] = (offset, length)
+        head = self.tables[b'head'][0]
+        self.units_per_em, = struct.unpack_from('>H', self.data, head + 18)
+        self.bbox = [self.scale(value) for value in struct.unpack_from(
+            '>4h', self.data, head + 36)]
+        self.long_loca, = struct.unpack_from('>h', self.data, head + 50)
+        hhea = self.tables[b'hhea'][0]
+        ascent, descent = struct.unpack_from('>2h', self.data, hhea + 4)
+        self.ascent, self.descent = self.scale(ascent), self.scale(descent)
+        num_metrics, = struct.unpack_from('>H', self.data, hhea + 34)
+        self.widths = [
+            self.scale(struct.unpack_from(
+                '>H', self.data, self.tables[b'hmtx'][0] + 4 * index)[0])
+            for index in range(num_metrics)]
+        self.num_glyphs, = struct.unpack_from(
+            '>H', self.data, self.tables[b'maxp'][0] + 4)
+        self.cmap = self.read_cmap()
+
+    def scale(self, value):
+        return value * 1000 // self.units_per_em
+
+    def read_cmap(self):
+        cmap = self.tables[b'cmap'][0]
+        num_subtables, = struct.unpack_from('>H', self.data, cmap + 2)
+        for index in range(num_subtables):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', self.data, cmap + 4 + 8 * index)
+            subtable = cmap + offset
+            if (platform, encoding) == (3, 1) and struct.unpack_from(
+                    '>H', self.data, subtable)[0] == 4:
+                return self.read_cmap_format4(subtable)
+        raise ValueError('В шрифте нет Unicode-таблицы cmap формата 4')
+
+    def read_cmap_format4(self, subtable):
+        segments_x2, = struct.unpack_from('>H', self.data, subtable + 6)
+        segments = segments_x2 // 2
+        ends = struct.unpack_from(f'>{segments}H', self.data, subtable + 14)
+        starts_at = subtable + 16 + segments_x2
+        starts = struct.unpack_from(f'>{segments}H', self.data, starts_at)
+        deltas = struct.unpack_from(
+            f'>{segments}h', self.data, starts_at + segments_x2)
+        offsets_at = starts_at + 2 * segments_x2
+        range_offsets = struct.unpack_from(
+            f'>{segments}H', self.data, offsets_at)
+        mapping = {}
+        for index in range(segments):
+            for code in range(starts[index], ends[index] + 1):
+                if code == 0xFFFF:
+                    continue
+                if range_offsets[index] == 0:
+                    glyph = (code + deltas[index]) & 0xFFFF
+                else:
+                    glyph, = struct.unpack_from(
+                        '>H', self.data,
+                        offsets_at + 2 * index + range_offsets[index]
+                        + 2 * (code - starts[index]))
+                    if glyph:
+                        glyph = (glyph + deltas[index]) & 0xFFFF
+                mapping[code] = glyph
+        return mapping
+
+    def width(self, glyph):
+        return self.widths[min(glyph, len(self.widths) - 1)]
+
+    def glyph_ranges(self):
+        """Смещения глифов в таблице glyf по таблице loca."""
+        offset, _ = self.tables[b'loca']
+        count = self.num_glyphs + 1
+        if self.long_loca:
+            return struct.unpack_from(f'>{count}I', self.data, offset)
+        return [value * 2 for value in struct.unpack_from(
+            f'>{count}H', self.data, offset)]
+
+    def components(self, glyph_data):
+        """Глифы, из которых собран составной глиф."""
+        if len(glyph_data) < 10 or struct.unpack_from(
+                '>h', glyph_data)[0] >= 0:
+            return []
+        components, position, flags = [], 10, COMPOSITE_MORE
+        while flags & COMPOSITE_MORE:
+            flags, glyph = struct.unpack_from('>HH', glyph_data, position)
+            components.append(glyph)
+            position += 4 + (4 if flags & COMPOSITE_WORDS else 2)
+            for flag, size in COMPOSITE_TRANSFORMS:
+                if flags & flag:
+                    position += size
+        return components
+
+    def subset(self, glyphs):
+        """Файл шрифта, где контуры есть только у glyphs.
+
+        Номера глифов не меняются (в PDF они служат CID), остальные
+        глифы просто пустые. Таблицы, которые PDF не читает (cmap,
+        name, кернинг), отбрасываются: DejaVuSans занимает 700 КБ, а
+        список покупок использует сотню глифов.
+        """
+        glyf, _ = self.tables[b'glyf']
+        ranges = self.glyph_ranges()
+        keep, pending = set(), {0, *glyphs}
+        while pending:
+            glyph = pending.pop()
+            if glyph in keep or glyph >= self.num_glyphs:
+                continue
+            keep.add(glyph)
+            pending.update(self.components(
+                self.data[glyf + ranges[glyph]:glyf + ranges[glyph + 1]]))
+        glyph_table, loca = bytearray(), [0]
+        for glyph in range(self.num_glyphs):
+            if glyph in keep:
+                glyph_table += self.data[glyf + ranges[glyph]:
+                                         glyf + ranges[glyph + 1]]
+                glyph_table += bytes(-len(glyph_table) % 4)
+            loca.append(len(glyph_table))
+        head_offset, head_length = self.tables[b'head']
+        head = bytearray(self.data[head_offset:head_offset + head_length])
+        # Контрольная сумма файла не нужна PDF; loca всегда длинная.
+        struct.pack_into('>I', head, 8, 0)
+        struct.pack_into('>h', head, 50, 1)
+        tables = {
+            b'head': bytes(head),
+            b'glyf': bytes(glyph_table),
+            b'loca': struct.pack(f'>{len(loca)}I', *loca),
+        }
+        for tag in PDF_FONT_TABLES:
+            if tag not in tables and tag in self.tables:
+                offset, length = self.tables[tag]
+                tables[tag] = self.data[offset:offset + length]
+        return font_file(tables)
+
+
+def table_checksum(data):
+    data += bytes(-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def font_file(tables):
+    """Собирает файл TrueType из таблиц {тег: данные}."""
+    count = len(tables)
+    power = 1 << (count.bit_length() - 1)
+    header = struct.pack('>IHHHH', 0x00010000, count, power * 16,
+                         power.bit_length() - 1, (count - power) * 16)
+    offset = len(header) + 16 * count
+    records, body = [], bytearray()
+    for tag in sorted(tables):
+        data = tables[tag]
+        records.append(struct.pack('>4sIII', tag, table_checksum(data),
+                                   offset + len(body), len(data)))
+        body += data + bytes(-len(data) % 4)
+    return header + b''.join(records) + bytes(body)
+
+
+@lru_cache()
+def load_pdf_font(path):
+    return PdfFont(path)
+
+
+class PdfWriter:
+    """Пишет PDF по частям, запоминая смещения объектов для xref."""
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.next_id = 1
+
+    def reserve(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def write(self, chunk):
+        self.offset += len(chunk)
+        return chunk
+
+    def object(self, object_id, body):
+        self.offsets[object_id] = self.offset
+        return self.write(b'%d 0 obj\n%s\nendobj\n' % (object_id, body))
+
+    def stream(self, object_id, data, extra=b''):
+        return self.object(object_id, b'<< /Length %d%s >>\nstream\n%s\n'
+                                      b'endstream' % (len(data), extra, data))
+
+    def trailer(self, root_id):
+        xref = [b'xref\n0 %d\n0000000000 65535 f \n' % self.next_id]
+        xref += [b'%010d 00000 n \n' % self.offsets[object_id]
+                 for object_id in range(1, self.next_id)]
+        return self.write(b''.join(xref) + (
+            b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+            % (self.next_id, root_id, self.offset)))
+
+
+def pdf_text(font, glyphs, text):
+    line = [font.cmap.get(ord(char), 0) for char in text]
+    glyphs.update(zip(line, text))
+    return b'<%s> Tj T*' % ''.join(f'{glyph:04X}' for glyph in line).encode()
+
+
+def pdf_page(writer, pages_id, font_id, lines):
+    content_id, page_id = writer.reserve(), writer.reserve()
+    content = b'BT /F1 %d Tf %d TL %d %d Td\n%s\nET' % (
+        PDF_FONT_SIZE, PDF_LEADING, PDF_MARGIN,
+        PDF_PAGE_HEIGHT - PDF_MARGIN, b'\n'.join(lines))
+    return page_id, writer.stream(
+        content_id, zlib.compress(content), b' /Filter /FlateDecode'
+    ) + writer.object(page_id, (
+        b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+        b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+        % (pages_id, PDF_PAGE_WIDTH, PDF_PAGE_HEIGHT, font_id, content_id)))
+
+
+def pdf_font_objects(writer, font, font_id, glyphs):
+    cid_font_id, descriptor_id, file_id, unicode_id = (
+        writer.reserve() for _ in range(4))
+    subset = font.subset(glyphs)
+    # Имя подмножества шрифта по PDF 1.4 - шесть заглавных букв и +.
+    tag = zlib.crc32(repr(sorted(glyphs)).encode())
+    name = bytes(65 + (tag >> (5 * index)) % 26
+                 for index in range(6)) + b'+' + font.name
+    widths = b' '.join(b'%d [%d]' % (glyph, font.width(glyph))
+                       for glyph in sorted(glyphs))
+    to_unicode = b'\n'.join(
+        b'1 beginbfchar <%04X> <%s> endbfchar'
+        % (glyph, char.encode('utf-16-be').hex().upper().encode())
+        for glyph, char in sorted(glyphs.items()))
+    to_unicode = (
+        b'/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n'
+        b'/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+        b'/Supplement 0 >> def\n/CMapName /Adobe-Identity-UCS def\n'
+        b'1 begincodespacerange <0000> <FFFF> endcodespacerange\n'
+        b'%s\nendcmap CMapName currentdict /CMap defineresource pop end end'
+        % to_unicode)
+    return b''.join([
+        writer.object(font_id, (
+            b'<< /Type /Font /Subtype /Type0 /BaseFont /%s '
+            b'/Encoding /Identity-H /DescendantFonts [%d 0 R] '
+            b'/ToUnicode %d 0 R >>' % (name, cid_font_id, unicode_id))),
+        writer.object(cid_font_id, (
+            b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s '
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            b'/Supplement 0 >> /FontDescriptor %d 0 R '
+            b'/CIDToGIDMap /Identity /W [%s] >>'
+            % (name, descriptor_id, widths))),
+        writer.object(descriptor_id, (
+            b'<< /Type /FontDescriptor /FontName /%s /Flags 32 '
+            b'/FontBBox [%d %d %d %d] /ItalicAngle 0 /Ascent %d '
+            b'/Descent %d /CapHeight %d /StemV 80 /FontFile2 %d 0 R >>'
+            % (name, *font.bbox, font.ascent, font.descent,
+               font.ascent, file_id))),
+        writer.stream(file_id, zlib.compress(subset),
+                      b' /Filter /FlateDecode /Length1 %d' % len(subset)),
+        writer.stream(unicode_id, to_unicode),
+    ])
+
+
+@shopping_cart_exporter('pdf', 'application/pdf')
+def forming_shopping_cart_pdf(rows):
+    # Шрифт читается до начала ответа: если его нет, клиент получит
+    # ошибку, а не оборванный файл с кодом 200.
+    try:
+        font = load_pdf_font(settings.SHOPPING_CART_PDF_FONT)
+    except (OSError, ValueError, struct.error) as error:
+        logger.error('Не удалось загрузить шрифт %s: %s',
+                     settings.SHOPPING_CART_PDF_FONT, error)
+        raise ExportUnavailable('Выгрузка в PDF временно недоступна')
+    return pdf_chunks(rows, font)
+
+
+def pdf_chunks(rows, font):
+    writer = PdfWriter()
+    catalog_id, pages_id, font_id = (writer.reserve() for _ in range(3))
+    yield writer.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    glyphs = {}
+    page_ids = []
+    lines = [pdf_text(font, glyphs, 'Список покупок'), b'T*']
+    for name, amount, measurement_unit in rows:
+        lines.append(pdf_text(
+            font, glyphs, f'{name}: {amount} {measurement_unit}'))
+        if len(lines) == PDF_LINES_PER_PAGE:
+            page_id, chunk = pdf_page(writer, pages_id, font_id, lines)
+            page_ids.append(page_id)
+            lines = []
+            yield chunk
+    if lines or not page_ids:
+        page_id, chunk = pdf_page(writer, pages_id, font_id, lines)
+        page_ids.append(page_id)
+        yield chunk
+    yield pdf_font_objects(writer, font, font_id, glyphs)
+    yield writer.object(pages_id, b'<< /Type /Pages /Kids [%s] /Count %d >>'
+                        % (b' '.join(b'%d 0 R' % page_id
+                                     for page_id in page_ids),
+                           len(page_ids)))
+    yield writer.object(
+        catalog_id, b'<< /Type /Catalog /Pages %d 0 R >>' % pages_id)
+    yield writer.trailer(catalog_id)
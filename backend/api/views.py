@@ -1,30 +1,47 @@
-from django.db.models import Prefetch, Count
-from django.http import HttpResponse
+from django.core.cache import caches
+from django.db.models import (BooleanField, Prefetch, Value,
+                              prefetch_related_objects)
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from rest_framework import permissions, status, viewsets
+from django.utils.decorators import method_decorator
+from rest_framework import permissions, serializers, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from .filters import ReceiptFilter, IngredientFilter
-from recipes.models import (Favorite, Ingredient, Receipt, ShoppingCart, Tag)
+from recipes.models import Favorite, Ingredient, Receipt, ShoppingCart, Tag
 from users.models import User, Subscribe
 from .serializers import (ChangePasswordSerializer, IngredientSerializer,
-                          ReceiptCreateSerializer, ReceiptGetSerializer,
+                          ReceiptCreateSerializer, ReceiptMatchSerializer,
+                          ReceiptReadSerializer,
+                          ReceiptRepresantaionSerializer,
                           TagSerializer, UserSerializer,
                           UserSubscriptionSerializer, SubscribeSerializer,
                           FavoriteSerializer, ShoppingCartSerializer,
                           CreateUserSerializer)
-from .utils import forming_shopping_cart_file
+from .autocomplete import ingredient_index
+from .recipe_match import RecipeMatches, recipe_match_index
+from .caching import (count_cache_access, get_table_versions,
+                      receipt_list_cache_key, versioned, versioned_receipt)
+from .constants import (AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MAX_LIMIT,
+                        INGREDIENT_MAX_AGE, MATCH_MAX_INGREDIENTS,
+                        TAG_MAX_AGE)
+from .utils import (ExportUnavailable, IgnoreClientContentNegotiation,
+                    SHOPPING_CART_EXPORTERS, get_recipes_limit,
+                    shopping_cart_rows)
+from .pagination import (FeedPagination, MatchPagination,
+                         PageLimitPagination, PopularPagination)
 from .permissions import IsOwnerOrReadOnly
+from .profiling import profile_stats
 
 
 class UserViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.AllowAny]
     serializer_class = UserSerializer
     queryset = User.objects.all()
-    pagination_class = PageNumberPagination
+    pagination_class = PageLimitPagination
 
     def create(self, request):
         serializer = CreateUserSerializer(data=request.data)
@@ -58,11 +75,16 @@ class UserViewSet(viewsets.ModelViewSet):
             permission_classes=[permissions.IsAuthenticated])
     def subscriptions(self, request):
         subscribed_authors = User.objects.filter(
-            creator__user=request.user).prefetch_related(
-            Prefetch('recipes', queryset=Receipt.objects.all())
-        ).annotate(recipes_count=Count('recipes'))
+            creator__user=request.user).annotate(
+                is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('-id')
 
         page = self.paginate_queryset(subscribed_authors)
+        recipes = Receipt.objects.short()
+        limit = get_recipes_limit(request)
+        if limit is not None:
+            recipes = recipes.latest_by_author(page, limit)
+        prefetch_related_objects(page, Prefetch('recipes', queryset=recipes))
         serializer = UserSubscriptionSerializer(page, many=True,
                                                 context={'request': request})
         return self.get_paginated_response(serializer.data)
@@ -88,6 +110,10 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@method_decorator(versioned('tag', public=True, max_age=TAG_MAX_AGE),
+                  name='list')
+@method_decorator(versioned('tag', public=True, max_age=TAG_MAX_AGE),
+                  name='retrieve')
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -95,6 +121,12 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
+@method_decorator(versioned('ingredient', public=True,
+                            max_age=INGREDIENT_MAX_AGE), name='list')
+@method_decorator(versioned('ingredient', public=True,
+                            max_age=INGREDIENT_MAX_AGE), name='retrieve')
+@method_decorator(versioned('ingredient', public=True,
+                            max_age=INGREDIENT_MAX_AGE), name='autocomplete')
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -103,7 +135,20 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
 
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        try:
+            limit = max(1, min(int(request.query_params.get('limit')),
+                               AUTOCOMPLETE_MAX_LIMIT))
+        except (TypeError, ValueError):
+            limit = AUTOCOMPLETE_LIMIT
+        return Response(ingredient_index.search(
+            request.query_params.get('name', ''), limit,
+            get_table_versions(request, ('ingredient',))['ingredient'][0]))
 
+
+@method_decorator(versioned_receipt(private=True, no_cache=True),
+                  name='retrieve')
 class ReceiptViewSet(viewsets.ModelViewSet):
     queryset = Receipt.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly,
@@ -111,11 +156,84 @@ class ReceiptViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = ReceiptFilter
 
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve', 'by_ingredients', 'feed'):
+            return Receipt.objects.for_representation(self.request.user)
+        if self.action == 'popular':
+            return Receipt.objects.for_representation(
+                self.request.user).popular()
+        if self.action in ('favorite', 'shopping_cart', 'similar'):
+            return Receipt.objects.short()
+        return Receipt.objects.all()
+
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
-            return ReceiptGetSerializer
+        if self.action in ('list', 'retrieve', 'popular', 'feed'):
+            return ReceiptReadSerializer
+        if self.action == 'by_ingredients':
+            return ReceiptMatchSerializer
+        if self.action == 'similar':
+            return ReceiptRepresantaionSerializer
         return ReceiptCreateSerializer
 
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        cache = caches['recipes']
+        key = receipt_list_cache_key(request)
+        data = cache.get(key)
+        count_cache_access(cache, hit=data is not None)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    @action(detail=False, methods=['get'],
+            pagination_class=PopularPagination)
+    def popular(self, request):
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], pagination_class=FeedPagination,
+            permission_classes=[permissions.IsAuthenticated])
+    def feed(self, request):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], pagination_class=MatchPagination)
+    def by_ingredients(self, request):
+        try:
+            ingredient_ids = {
+                int(value) for values in request.query_params.getlist(
+                    'ingredients') for value in values.split(',') if value}
+        except ValueError:
+            raise serializers.ValidationError(
+                {'ingredients': 'Ожидаются id ингредиентов'})
+        if not ingredient_ids:
+            raise serializers.ValidationError(
+                {'ingredients': 'Нужен хотя бы один ингредиент'})
+        if len(ingredient_ids) > MATCH_MAX_INGREDIENTS:
+            raise serializers.ValidationError(
+                {'ingredients': 'Не больше '
+                 f'{MATCH_MAX_INGREDIENTS} ингредиентов'})
+        page = self.paginate_queryset(RecipeMatches(
+            recipe_match_index, self.get_queryset(), ingredient_ids))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        recipe = self.get_object()
+        serializer = self.get_serializer(
+            Receipt.objects.short().filter(similar_to__recipe=recipe).order_by(
+                'similar_to__position'), many=True)
+        return Response(serializer.data)
+
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=[permissions.IsAuthenticated])
     def favorite(self, request, pk=None):
@@ -147,16 +265,40 @@ class ReceiptViewSet(viewsets.ModelViewSet):
                                 status=status.HTTP_201_CREATED)
             return Response(serializer.errors,
                             status=status.HTTP_400_BAD_REQUEST)
-        instance = get_object_or_404(
-            ShoppingCart, user=request.user, recipe=recipe)
-        instance.delete()
+        get_object_or_404(
+            ShoppingCart, user=request.user, recipe=recipe).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['get'],
-            permission_classes=[permissions.IsAuthenticated])
+            permission_classes=[permissions.IsAuthenticated],
+            content_negotiation_class=IgnoreClientContentNegotiation)
     def download_shopping_cart(self, request):
-        recipes = Receipt.objects.filter(
-            shopping_carts__user=request.user).prefetch_related(
-                'receipt_ingredient__ingredient')
-        return HttpResponse(forming_shopping_cart_file(recipes),
-                            content_type='text/plain')
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_CART_EXPORTERS:
+            return Response(
+                {'format': 'Доступные форматы: '
+                 + ', '.join(SHOPPING_CART_EXPORTERS)},
+                status=status.HTTP_400_BAD_REQUEST)
+        exporter, content_type = SHOPPING_CART_EXPORTERS[file_format]
+        try:
+            content = exporter(shopping_cart_rows(request.user))
+        except ExportUnavailable as error:
+            return Response({'format': str(error)},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{file_format}"')
+        return response
+
+
+class ProfilingView(APIView):
+    """Сводка ProfilingMiddleware по view этого процесса; DELETE
+    обнуляет её."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(profile_stats.report())
+
+    def delete(self, request):
+        profile_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
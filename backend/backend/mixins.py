@@ -0,0 +1,20 @@
+class SavedSeparatelyMixin:
+    """Модель, часть полей которой пишут только UPDATE из сигналов и
+    команд: счётчики вида x = x + 1, служебные флаги.
+
+    Сохранение уже существующего объекта без update_fields пишет все
+    загруженные поля, кроме SAVED_SEPARATELY, чтобы не затереть их
+    прочитанными раньше значениями.
+    """
+
+    SAVED_SEPARATELY = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and field.name not in self.SAVED_SEPARATELY]
+        super().save(*args, **kwargs)
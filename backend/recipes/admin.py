@@ -4,7 +4,8 @@ from django.core.exceptions import ValidationError
 from django.forms.models import BaseInlineFormSet
 
 from recipes.models import (Favorite, Ingredient, Receipt, ReceiptIngredient,
-                            ShoppingCart, Tag)
+                            RecipePopularity, ShoppingCart, ShoppingListItem,
+                            SimilarRecipe, Tag)
 from .constants import MAX_COOKING_TIME, MIN_COOKING_TIME
 
 
@@ -29,7 +30,12 @@ class ReceiptAdmin(admin.ModelAdmin):
         ReceiptIngredientInline,
     ]
     list_filter = ('tags',)
-    list_display = ('name', 'author',)
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.image_variants = None
+        super().save_model(request, obj, form, change)
 
     def clean(self):
         cleaned_data = super().clean()
@@ -48,3 +54,6 @@ admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(ReceiptIngredient)
 admin.site.register(Favorite)
 admin.site.register(ShoppingCart)
+admin.site.register(ShoppingListItem)
+admin.site.register(RecipePopularity)
+admin.site.register(SimilarRecipe)
@@ -5,3 +5,38 @@ MAX_COOKING_TIME = 180
 MIN_AMOUNT = 1
 MAX_AMOUNT = 10000
 HEX_REGEX = r'^#([A-Fa-f0-9]{6}|[A-Fa-f0-9]{3})$'
+SEARCH_CONFIG = 'russian'
+
+IMAGE_VARIANTS_DIR = 'images/recipes/variants/'
+# Наибольшая сторона варианта: карточка в списке, страница рецепта и
+# страница рецепта на экранах с двойной плотностью.
+IMAGE_VARIANT_SIZES = {'card': 480, 'detail': 960, 'retina': 1920}
+IMAGE_VARIANT_FORMATS = ('webp', 'avif')
+IMAGE_VARIANT_QUALITY = 80
+
+# Популярность: вклад добавления в избранное или корзину убывает вдвое
+# каждые POPULARITY_HALF_LIFE_DAYS дней, старше окна не учитывается.
+POPULARITY_HALF_LIFE_DAYS = 7
+POPULARITY_WINDOW_DAYS = 90
+POPULARITY_FAVORITE_WEIGHT = 1
+POPULARITY_CART_WEIGHT = 2
+
+# Похожие рецепты: сколько хранить на рецепт, вес тега относительно
+# ингредиента. Кандидаты набираются по самым редким признакам рецепта,
+# пока не просмотрено SIMILAR_CANDIDATES_BUDGET записей; точная близость
+# считается для SIMILAR_RESCORE_FACTOR * SIMILAR_TOP лучших из них.
+SIMILAR_TOP = 10
+SIMILAR_TAG_WEIGHT = 0.5
+SIMILAR_CANDIDATES_BUDGET = 5000
+SIMILAR_RESCORE_FACTOR = 5
+
+# Лента подписок: новый рецепт раскладывается по лентам подписчиков,
+# если их у автора не больше FEED_FAN_OUT_LIMIT. При подписке в ленту
+# добавляются FEED_BACKFILL последних рецептов автора.
+FEED_FAN_OUT_LIMIT = 10000
+FEED_BACKFILL = 100
+
+# Удалённые рецепты помнятся столько дней, чтобы индексы в памяти
+# процессов выбросили их при синхронизации; индекс, не обновлявшийся
+# дольше, строится заново.
+DELETED_RECIPES_KEEP_DAYS = 7
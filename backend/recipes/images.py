@@ -0,0 +1,51 @@
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .constants import (IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY,
+                        IMAGE_VARIANT_SIZES, IMAGE_VARIANTS_DIR)
+
+Image.init()
+# AVIF есть не во всех сборках Pillow.
+VARIANT_FORMATS = [file_format for file_format in IMAGE_VARIANT_FORMATS
+                   if f'.{file_format}' in Image.registered_extensions()]
+
+
+def make_variants(name, storage=default_storage):
+    """Сохраняет уменьшенные копии картинки name во всех форматах.
+
+    Возвращает {размер: {формат: имя файла}}. Если картинка меньше
+    размера, копия не увеличивается, а совпавшие по размеру варианты
+    ссылаются на одни и те же файлы.
+    """
+    stem = PurePosixPath(name).stem
+    sizes = sorted(IMAGE_VARIANT_SIZES.items(), key=lambda item: item[1])
+    variants, saved = {}, {}
+    with storage.open(name) as file, Image.open(file) as image:
+        largest = sizes[-1][1]
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info
+                or image.mode in ('LA', 'PA') else 'RGB')
+        for size, side in sizes:
+            resized = image.copy()
+            resized.thumbnail((side, side), Image.LANCZOS)
+            if resized.size not in saved:
+                saved[resized.size] = {
+                    file_format: storage.save(
+                        f'{IMAGE_VARIANTS_DIR}{stem}_{size}.{file_format}',
+                        ContentFile(encode(resized, file_format)))
+                    for file_format in VARIANT_FORMATS}
+            variants[size] = saved[resized.size]
+    return variants
+
+
+def encode(image, file_format):
+    buffer = BytesIO()
+    image.save(buffer, file_format.upper(), quality=IMAGE_VARIANT_QUALITY)
+    return buffer.getvalue()
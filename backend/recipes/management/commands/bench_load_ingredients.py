@@ -0,0 +1,56 @@
+import csv
+import tempfile
+import time
+from io import StringIO
+from typing import Any
+
+from django.core.management import call_command
+
+from recipes.management.seeding import SeedingCommand
+from recipes.models import Ingredient
+
+UNITS = ['г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'стакан']
+
+
+class Command(SeedingCommand):
+    help = ('Замеряет load_csv на синтетическом каталоге и сравнивает его '
+            'с построчным get_or_create. Пишет в базу, поэтому запускать '
+            'на отдельной базе с --yes-seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--legacy-rows', type=int, default=2000)
+
+    def handle(self, *args: Any, **options: Any):
+        rows = options['rows']
+        with tempfile.NamedTemporaryFile('w+', suffix='.csv',
+                                         encoding='utf-8') as file:
+            writer = csv.writer(file)
+            for index in range(rows):
+                # Каждая двадцатая строка повторяет предыдущую.
+                key = index - 1 if index % 20 == 19 else index
+                writer.writerow((f'bench {key}', UNITS[key % len(UNITS)]))
+            file.flush()
+            for title in ('первая загрузка', 'повторная загрузка'):
+                output = StringIO()
+                start = time.perf_counter()
+                call_command('load_csv', file.name, stdout=output,
+                             batch_size=options['batch_size'])
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f'{title}: {rows} строк, {elapsed:.1f} с, '
+                    f'{rows / elapsed:.0f} строк/с. {output.getvalue()}',
+                    ending='')
+
+        legacy = options['legacy_rows']
+        start = time.perf_counter()
+        for index in range(legacy):
+            Ingredient.objects.get_or_create(
+                name=f'bench legacy {index}',
+                measurement_unit=UNITS[index % len(UNITS)])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'get_or_create: {legacy} строк, {elapsed:.1f} с, '
+            f'{legacy / elapsed:.0f} строк/с, на {rows} строк ушло бы '
+            f'~{rows / legacy * elapsed:.0f} с')
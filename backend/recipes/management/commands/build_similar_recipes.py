@@ -0,0 +1,78 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from recipes.constants import SIMILAR_TOP
+from recipes.models import Receipt, SimilarRecipe
+from recipes.similarity import RecipeVectors, recipe_features, save_neighbours
+
+
+def batches(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает похожие рецепты для новых и изменённых рецептов, '
+            'а также для рецептов, в чьи списки они попадают или откуда '
+            'выбывают. С --all пересчитывает все рецепты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересчитать все рецепты')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args: Any, **options: Any):
+        started = timezone.now()
+        start = time.perf_counter()
+        self.vectors = RecipeVectors(recipe_features())
+        self.stdout.write(
+            f'Векторы: {len(self.vectors.ids)} рецептов, '
+            f'{len(self.vectors.weights)} признаков, '
+            f'{time.perf_counter() - start:.1f} с')
+        recipes = Receipt.objects.all()
+        if not options['all']:
+            recipes = recipes.filter(
+                Q(similar_updated_at__isnull=True)
+                | Q(similar_updated_at__lt=F('updated_at')))
+        stale = set(recipes.values_list('id', flat=True))
+        # Наибольшая близость изменённых рецептов к каждому другому.
+        best = {}
+        total = self.rebuild(stale, started, options['batch_size'],
+                             None if options['all'] else best)
+        if not options['all']:
+            affected = set()
+            for batch in batches(stale, options['batch_size']):
+                affected.update(SimilarRecipe.objects.filter(
+                    similar_id__in=batch).values_list('recipe_id', flat=True))
+            for batch in batches(set(best) - stale, options['batch_size']):
+                last = dict(SimilarRecipe.objects.filter(
+                    recipe_id__in=batch, position=SIMILAR_TOP).values_list(
+                        'recipe_id', 'score'))
+                affected.update(recipe_id for recipe_id in batch
+                                if best[recipe_id] > last.get(recipe_id, 0))
+            total += self.rebuild(affected - stale, started,
+                                  options['batch_size'])
+        self.stdout.write(
+            f'Пересчитаны похожие для {total} рецептов за '
+            f'{time.perf_counter() - start:.1f} с')
+
+    def rebuild(self, recipe_ids, started, batch_size, best=None):
+        for batch in batches(sorted(recipe_ids), batch_size):
+            neighbours = {}
+            for recipe_id in batch:
+                index = self.vectors.index(recipe_id)
+                neighbours[recipe_id] = (
+                    [] if index is None else self.vectors.neighbours(index))
+                if best is not None:
+                    for score, other in neighbours[recipe_id]:
+                        if score > best.get(other, 0):
+                            best[other] = score
+            save_neighbours(neighbours)
+            Receipt.objects.filter(pk__in=batch).update(
+                similar_updated_at=started)
+        return len(recipe_ids)
@@ -0,0 +1,58 @@
+import posixpath
+from datetime import timedelta
+from typing import Any
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import Receipt
+
+MEDIA_DIR = 'images/recipes/'
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки рецептов, на которые не ссылается ни один '
+            'рецепт (ни как оригинал, ни как уменьшенная копия)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено')
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд: их могли только '
+                 'что загрузить, а рецепт ещё не сохранён')
+
+    def handle(self, *args: Any, **options: Any):
+        referenced = set()
+        for image, variants in Receipt.objects.values_list(
+                'image', 'image_variants').iterator():
+            referenced.add(image)
+            if variants and 'error' not in variants:
+                referenced.update(name for files in variants.values()
+                                  for name in files.values())
+        border = timezone.now() - timedelta(seconds=options['min_age'])
+        removed, size = 0, 0
+        for name in walk(default_storage, MEDIA_DIR):
+            if (name in referenced
+                    or default_storage.get_modified_time(name) > border):
+                continue
+            removed += 1
+            size += default_storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+        self.stdout.write(
+            f'{"Будет удалено" if options["dry_run"] else "Удалено"} '
+            f'файлов: {removed}, {size / (1024 * 1024):.1f} МБ')
+
+
+def walk(storage, directory):
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
@@ -1,26 +1,132 @@
 import csv
+import json
+from pathlib import Path
 from typing import Any
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from recipes.constants import CHARFIELD_MAX_LENGTH
 from recipes.models import Ingredient
+from recipes.signals import ingredients_imported
+
+DEFAULT_PATH = './data/ingredients.csv'
+BATCH_SIZE = 1000
+READ_SIZE = 1 << 16
 
 
 class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV или JSON. Повторная загрузка '
+            'того же файла ничего не меняет.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--format', choices=READERS,
+                            help='По умолчанию - по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, ничего не записывая')
+
     def handle(self, *args: Any, **options: Any):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
         try:
-            ingredients_load()
-            print('Готово')
-        except Exception as error:
-            print(error)
-
-
-def ingredients_load():
-    with open('./data/ingredients.csv', encoding='utf-8') as csv_file:
-        fieldnames = ['name', 'measurement_unit']
-        csv_reader = csv.DictReader(csv_file, fieldnames=fieldnames)
-        for row in csv_reader:
-            Ingredient.objects.get_or_create(
-                name=row['name'],
-                measurement_unit=row['measurement_unit']
-            )
+            with open(path, encoding='utf-8') as file, transaction.atomic():
+                stats = ingredients_load(
+                    READERS[file_format](file), options['batch_size'],
+                    options['dry_run'])
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        if stats['inserted'] and not options['dry_run']:
+            ingredients_imported.send(sender=Ingredient)
+        self.stdout.write(
+            f'{"Будет добавлено" if options["dry_run"] else "Добавлено"}: '
+            f'{stats["inserted"]}, уже в базе: {stats["existing"]}, '
+            f'повторов в файле: {stats["duplicates"]}, '
+            f'некорректных строк: {stats["invalid"]}')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        yield row if len(row) == 2 else None
+
+
+def read_json(file):
+    """Построчно разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидался JSON-массив ингредиентов')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        if isinstance(item, dict):
+            yield item.get('name'), item.get('measurement_unit')
+        else:
+            yield None
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+def ingredients_load(rows, batch_size=BATCH_SIZE, dry_run=False):
+    stats = dict.fromkeys(('inserted', 'existing', 'duplicates', 'invalid'),
+                          0)
+    seen, batch = set(), []
+    for row in rows:
+        key = clean_row(row)
+        if key is None:
+            stats['invalid'] += 1
+        elif key in seen:
+            stats['duplicates'] += 1
+        else:
+            seen.add(key)
+            batch.append(key)
+            if len(batch) >= batch_size:
+                save_batch(batch, stats, dry_run)
+                batch = []
+    if batch:
+        save_batch(batch, stats, dry_run)
+    return stats
+
+
+def clean_row(row):
+    if row is None:
+        return None
+    name, measurement_unit = (
+        value.strip() if isinstance(value, str) else '' for value in row)
+    if (not name or not measurement_unit
+            or max(len(name), len(measurement_unit)) > CHARFIELD_MAX_LENGTH):
+        return None
+    return name, measurement_unit
+
+
+def save_batch(batch, stats, dry_run):
+    """Отбрасывает уже известные базе пары и вставляет остальные.
+
+    ignore_conflicts по ingredient_unique страхует от параллельной
+    загрузки того же каталога.
+    """
+    existing = set(Ingredient.objects.filter(
+        name__in={name for name, _ in batch}).values_list(
+            'name', 'measurement_unit'))
+    new = [key for key in batch if key not in existing]
+    stats['existing'] += len(batch) - len(new)
+    stats['inserted'] += len(new)
+    if not dry_run:
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in new), ignore_conflicts=True)
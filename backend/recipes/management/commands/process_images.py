@@ -0,0 +1,58 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.images import make_variants
+from recipes.models import Receipt, TableVersion
+
+
+class Command(BaseCommand):
+    help = ('Готовит уменьшенные WebP/AVIF-копии картинок рецептов. '
+            'Очередь - рецепты с пустым image_variants, новые картинки '
+            'попадают в неё автоматически.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь и завершиться')
+
+    def handle(self, *args: Any, **options: Any):
+        with ThreadPoolExecutor(options['workers']) as pool:
+            while True:
+                batch = list(Receipt.objects.filter(
+                    image_variants__isnull=True).exclude(image='').order_by(
+                        'id').values_list('id', 'image')[
+                            :options['batch_size']])
+                if batch:
+                    self.process(pool, batch)
+                elif options['once']:
+                    return
+                else:
+                    time.sleep(options['interval'])
+
+    def process(self, pool, batch):
+        failed = 0
+        for (pk, name), variants in zip(
+                batch, pool.map(process_image, [name for _, name in batch])):
+            failed += 'error' in variants
+            # Картинку могли заменить, пока шла обработка: тогда рецепт
+            # остаётся в очереди.
+            Receipt.objects.filter(pk=pk, image=name).update(
+                image_variants=variants, updated_at=timezone.now())
+        TableVersion.objects.bump('receipt')
+        self.stdout.write(f'Обработано картинок: {len(batch)}, '
+                          f'с ошибкой: {failed}')
+
+
+def process_image(name):
+    try:
+        return make_variants(name)
+    except Exception as error:
+        return {'error': str(error)}
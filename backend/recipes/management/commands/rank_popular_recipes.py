@@ -0,0 +1,28 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from recipes.constants import POPULARITY_HALF_LIFE_DAYS, POPULARITY_WINDOW_DAYS
+from recipes.models import RecipePopularity
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинг популярных рецептов для '
+            '/api/recipes/popular/. Запускать периодически, например '
+            'из cron раз в час.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--half-life', type=float,
+                            default=POPULARITY_HALF_LIFE_DAYS,
+                            help='Период полураспада вклада, дней')
+        parser.add_argument('--window', type=int,
+                            default=POPULARITY_WINDOW_DAYS,
+                            help='Учитывать добавления за столько дней')
+
+    def handle(self, *args: Any, **options: Any):
+        start = time.perf_counter()
+        total = RecipePopularity.objects.rebuild(options['half_life'],
+                                                 options['window'])
+        self.stdout.write(f'В рейтинге рецептов: {total}, '
+                          f'{time.perf_counter() - start:.1f} с')
@@ -0,0 +1,42 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.signals import COUNTERS
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, корзин, рецептов и '
+            'подписчиков и сообщает о расхождениях')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только сообщить о расхождениях')
+
+    @transaction.atomic
+    def handle(self, *args: Any, **options: Any):
+        total = 0
+        for counted, (field, model, counter) in COUNTERS.items():
+            fk = field[:-len('_id')]
+            actual = counted.objects.filter(**{fk: OuterRef('pk')}).order_by(
+                ).values(fk).annotate(total=Count('*')).values('total')
+            wrong = [
+                model(pk=pk, **{counter: value})
+                for pk, value in model.objects.annotate(
+                    actual=Coalesce(Subquery(actual), 0)).exclude(
+                        **{counter: F('actual')}).values_list(
+                            'pk', 'actual').iterator()]
+            total += len(wrong)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}, {counter}: '
+                f'неверных значений {len(wrong)}')
+            if not options['check']:
+                model.objects.bulk_update(wrong, [counter],
+                                          batch_size=BATCH_SIZE)
+        if options['check'] and total:
+            raise CommandError('Счётчики расходятся с данными')
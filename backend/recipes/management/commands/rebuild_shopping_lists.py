@@ -0,0 +1,48 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import ReceiptIngredient, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает списки покупок по корзинам и сообщает '
+            'о расхождениях')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только сообщить о расхождениях')
+
+    @transaction.atomic
+    def handle(self, *args: Any, **options: Any):
+        expected = {
+            (row['recipe__shopping_carts__user'], row['ingredient']):
+            row['total']
+            for row in ReceiptIngredient.objects.filter(
+                recipe__shopping_carts__isnull=False).values(
+                    'recipe__shopping_carts__user', 'ingredient').annotate(
+                        total=Sum('amount')).order_by().iterator()}
+        changed, extra = [], []
+        for item in ShoppingListItem.objects.select_for_update().iterator():
+            amount = expected.pop((item.user_id, item.ingredient_id), None)
+            if amount is None:
+                extra.append(item.pk)
+            elif amount != item.amount:
+                item.amount = amount
+                changed.append(item)
+        self.stdout.write(
+            f'Отсутствует строк: {len(expected)}, лишних: {len(extra)}, '
+            f'с неверным количеством: {len(changed)}')
+        if options['check']:
+            if expected or extra or changed:
+                raise CommandError('Списки покупок расходятся с корзинами')
+            return
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                             amount=amount)
+            for (user_id, ingredient_id), amount in expected.items())
+        ShoppingListItem.objects.bulk_update(changed, ['amount'])
+        ShoppingListItem.objects.filter(pk__in=extra).delete()
+        self.stdout.write('Готово')
@@ -0,0 +1,214 @@
+import io
+import random
+import time
+from itertools import accumulate
+from typing import Any
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from PIL import Image
+
+from recipes.management.seeding import SeedingCommand
+from recipes.constants import (FEED_BACKFILL, FEED_FAN_OUT_LIMIT,
+                               MAX_COOKING_TIME, MIN_AMOUNT, MIN_COOKING_TIME)
+from recipes.models import (Favorite, Ingredient, Receipt, ReceiptIngredient,
+                            ShoppingCart, TableVersion, Tag, TimelineEntry)
+from users.models import Subscribe, User
+
+BATCH_SIZE = 5000
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#2D9CDB',
+              '#EB5757', '#6FCF97', '#BB6BD9')
+
+
+def zipf_weights(count):
+    """Накопленные веса для rand.choices: k-й элемент выбирается в k раз
+    реже первого."""
+    return list(accumulate(1 / rank for rank in range(1, count + 1)))
+
+
+class Command(SeedingCommand):
+    help = ('Заполняет базу пользователями, подписками, рецептами, '
+            'избранным и корзинами для нагрузочных замеров. Одинаковые '
+            'параметры на пустой базе дают одинаковые данные.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--authors', type=int, default=200,
+                            help='Сколько пользователей публикуют рецепты')
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--ingredients', type=int, default=2000,
+                            help='Дополнить справочник ингредиентов до '
+                                 'этого количества')
+        parser.add_argument('--tags', type=int, default=len(TAG_COLORS))
+        parser.add_argument('--per-recipe', type=int, default=8,
+                            help='Среднее число ингредиентов в рецепте')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Среднее число подписок пользователя')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число рецептов в избранном')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Среднее число рецептов в корзине')
+
+    def handle(self, *args: Any, **options: Any):
+        seed = options['seed']
+        if User.objects.filter(username__startswith=f'seed-{seed}-').exists():
+            raise CommandError(f'Данные с --seed {seed} уже созданы')
+        if options['authors'] > options['users']:
+            raise CommandError('Авторов не может быть больше пользователей')
+        rand = random.Random(seed)
+        start = time.perf_counter()
+        tag_ids = self.seed_tags(options['tags'])
+        ingredient_ids = self.seed_ingredients(options['ingredients'])
+        user_ids = self.seed_users(seed, options['users'])
+        author_ids = user_ids[:options['authors']]
+        recipe_ids = self.seed_recipes(
+            rand, seed, options['recipes'], author_ids, tag_ids,
+            ingredient_ids, options['per_recipe'])
+        # Популярные рецепты - не обязательно самые старые.
+        popular_ids = rand.sample(recipe_ids, len(recipe_ids))
+        for model, field, average, choices in (
+                (Subscribe, 'author_id', options['follows'], author_ids),
+                (Favorite, 'recipe_id', options['favorites'], popular_ids),
+                (ShoppingCart, 'recipe_id', options['carts'], popular_ids)):
+            self.seed_links(rand, model, field, average, user_ids, choices)
+        self.stdout.write(
+            f'Создано пользователей: {len(user_ids)}, рецептов: '
+            f'{len(recipe_ids)}, подписок: {Subscribe.objects.count()}, '
+            f'в избранном: {Favorite.objects.count()}, в корзинах: '
+            f'{ShoppingCart.objects.count()}, '
+            f'{time.perf_counter() - start:.1f} с')
+
+        # bulk_create не шлёт сигналы: производные данные пересчитываются
+        # теми же командами, что исправляют их расхождения.
+        call_command('rebuild_counters', stdout=self.stdout)
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        self.seed_timelines(author_ids)
+        call_command('rank_popular_recipes', stdout=self.stdout)
+        TableVersion.objects.bump('tag', 'ingredient', 'receipt', 'user')
+        self.stdout.write(
+            f'Готово за {time.perf_counter() - start:.1f} с. Похожие '
+            f'рецепты считает build_similar_recipes, варианты картинок - '
+            f'process_images.')
+
+    def seed_tags(self, count):
+        existing = Tag.objects.count()
+        Tag.objects.bulk_create(
+            (Tag(name=f'Тег {index}', slug=f'tag-{index}',
+                 color=TAG_COLORS[index % len(TAG_COLORS)])
+             for index in range(existing, count)),
+            ignore_conflicts=True)
+        return list(Tag.objects.order_by('id').values_list('id', flat=True))
+
+    def seed_ingredients(self, count):
+        existing = Ingredient.objects.count()
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'Ингредиент {index}', measurement_unit='г')
+             for index in range(existing, count)),
+            batch_size=BATCH_SIZE, ignore_conflicts=True)
+        # Сначала идут ингредиенты из справочника, они и самые частые.
+        return list(Ingredient.objects.order_by('id').values_list(
+            'id', flat=True))
+
+    def seed_users(self, seed, count):
+        # Один хеш на всех: PBKDF2 для каждого занял бы минуты. Пароль
+        # непригоден для входа, замеры авторизуют пользователей сами.
+        password = make_password(None)
+        for offset in range(0, count, BATCH_SIZE):
+            User.objects.bulk_create(
+                User(username=f'seed-{seed}-{index}',
+                     email=f'seed-{seed}-{index}@example.com',
+                     first_name='Пользователь', last_name=str(index),
+                     password=password)
+                for index in range(offset, min(offset + BATCH_SIZE, count)))
+        return list(User.objects.filter(
+            username__startswith=f'seed-{seed}-').order_by('id').values_list(
+                'id', flat=True))
+
+    def seed_image(self):
+        content = io.BytesIO()
+        Image.new('RGB', (64, 64), TAG_COLORS[0]).save(content, 'PNG')
+        return default_storage.save('images/recipes/seed.png',
+                                    ContentFile(content.getvalue()))
+
+    def seed_recipes(self, rand, seed, count, author_ids, tag_ids,
+                     ingredient_ids, per_recipe):
+        image = self.seed_image()
+        author_weights = zipf_weights(len(author_ids))
+        ingredient_weights = zipf_weights(len(ingredient_ids))
+        recipe_ids = []
+        for offset in range(0, count, BATCH_SIZE):
+            batch = Receipt.objects.bulk_create(
+                Receipt(author_id=rand.choices(
+                            author_ids, cum_weights=author_weights)[0],
+                        name=f'Рецепт {seed}-{index}',
+                        text=f'Описание рецепта {index}',
+                        cooking_time=rand.randint(MIN_COOKING_TIME,
+                                                  MAX_COOKING_TIME),
+                        image=image)
+                for index in range(offset, min(offset + BATCH_SIZE, count)))
+            if batch[0].pk is None:
+                batch = sorted(Receipt.objects.order_by('-id')[:len(batch)],
+                               key=lambda recipe: recipe.pk)
+            tags, items = [], []
+            for recipe in batch:
+                tags.extend(
+                    Receipt.tags.through(receipt_id=recipe.pk, tag_id=tag_id)
+                    for tag_id in rand.sample(
+                        tag_ids, min(len(tag_ids), rand.randint(1, 3))))
+                chosen = sorted(set(rand.choices(
+                    ingredient_ids, cum_weights=ingredient_weights,
+                    k=max(1, int(rand.gauss(per_recipe, per_recipe / 3))))))
+                items.extend(
+                    ReceiptIngredient(
+                        recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                        amount=rand.randint(MIN_AMOUNT, 500))
+                    for ingredient_id in chosen)
+            Receipt.tags.through.objects.bulk_create(tags)
+            ReceiptIngredient.objects.bulk_create(items)
+            recipe_ids.extend(recipe.pk for recipe in batch)
+        return recipe_ids
+
+    def seed_links(self, rand, model, field, average, user_ids, choices):
+        """Связи пользователей с авторами или рецептами: число связей
+        распределено экспоненциально, выбор - по Ципфу."""
+        if not average or not choices:
+            return
+        weights = zipf_weights(len(choices))
+        batch = []
+        for user_id in user_ids:
+            count = min(len(choices), int(rand.expovariate(1 / average)))
+            batch.extend(
+                model(user_id=user_id, **{field: choice})
+                for choice in sorted(set(rand.choices(
+                    choices, cum_weights=weights, k=count)))
+                if model is not Subscribe or choice != user_id)
+            if len(batch) >= BATCH_SIZE:
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def seed_timelines(self, author_ids):
+        """Ленты подписчиков, как после подписки на каждого автора."""
+        User.objects.filter(subscribers_count__gt=FEED_FAN_OUT_LIMIT).update(
+            fan_out_on_read=True)
+        subscribers = {}
+        for user_id, author_id in Subscribe.objects.filter(
+                author_id__in=author_ids,
+                author__fan_out_on_read=False).values_list(
+                    'user_id', 'author_id').iterator():
+            subscribers.setdefault(author_id, []).append(user_id)
+        total = 0
+        for author_id, user_ids in subscribers.items():
+            recipe_ids = list(Receipt.objects.filter(
+                author_id=author_id).order_by('-id').values_list(
+                    'id', flat=True)[:FEED_BACKFILL])
+            TimelineEntry.objects.bulk_create(
+                (TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+                 for user_id in user_ids for recipe_id in recipe_ids),
+                batch_size=BATCH_SIZE, ignore_conflicts=True)
+            total += len(user_ids) * len(recipe_ids)
+        self.stdout.write(f'Записей в лентах подписчиков: {total}')
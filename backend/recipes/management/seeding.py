@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class SeedingCommand(BaseCommand):
+    """Команда, которая пишет в базу синтетические данные для замеров.
+
+    Без --yes-seed не запускается: случайный запуск на рабочей базе
+    добавил бы в неё тысячи пользователей и рецептов и пересчитал
+    производные таблицы.
+    """
+
+    def create_parser(self, prog_name, subcommand, **kwargs):
+        parser = super().create_parser(prog_name, subcommand, **kwargs)
+        parser.add_argument(
+            '--yes-seed', action='store_true',
+            help='Подтвердить запись синтетических данных в базу')
+        return parser
+
+    def execute(self, *args, **options):
+        if not options['yes_seed']:
+            raise CommandError(
+                f'Команда пишет синтетические данные в базу '
+                f'"{connection.settings_dict["NAME"]}". Запускайте её на '
+                f'отдельной базе с флагом --yes-seed.')
+        return super().execute(*args, **options)
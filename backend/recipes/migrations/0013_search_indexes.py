@@ -0,0 +1,52 @@
+from django.db import migrations
+
+SEARCH_CONFIG = 'russian'
+
+# Django строит icontains как UPPER("name"::text) LIKE UPPER(%s), поэтому
+# триграммные индексы строятся по тому же выражению.
+TRIGRAM_INDEXES = [
+    ('receipt_name_trgm', 'recipes_receipt'),
+    ('ingredient_name_trgm', 'recipes_ingredient'),
+]
+
+
+def search_vector_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return GinIndex(
+        SearchVector('name', config=SEARCH_CONFIG, weight='A')
+        + SearchVector('text', config=SEARCH_CONFIG, weight='B'),
+        name='receipt_search_vector')
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.add_index(apps.get_model('recipes', 'Receipt'),
+                            search_vector_index())
+    for name, table in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX "{name}" ON "{table}" '
+            f'USING gin ((UPPER("name"::text)) gin_trgm_ops)')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.remove_index(apps.get_model('recipes', 'Receipt'),
+                               search_vector_index())
+    for name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_receipt_updated_at_tableversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='image_variants',
+            field=models.JSONField(blank=True, editable=False, help_text='Пусто, пока process_images не обработал картинку', null=True, verbose_name='Варианты картинки'),
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(condition=models.Q(('image_variants__isnull', True)), fields=['id'], name='receipt_image_pending'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:33
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# (модель со счётчиком, поле счётчика, считаемая модель, её внешний ключ)
+COUNTERS = [
+    ('recipes.Receipt', 'favorites_count', 'recipes.Favorite', 'recipe'),
+    ('recipes.Receipt', 'in_carts_count', 'recipes.ShoppingCart', 'recipe'),
+    ('users.User', 'recipes_count', 'recipes.Receipt', 'author'),
+    ('users.User', 'subscribers_count', 'users.Subscribe', 'author'),
+]
+
+
+def fill_counters(apps, schema_editor):
+    for model, counter, counted, fk in COUNTERS:
+        actual = apps.get_model(counted).objects.filter(
+            **{fk: OuterRef('pk')}).order_by().values(fk).annotate(
+                total=Count('*')).values('total')
+        apps.get_model(model).objects.update(
+            **{counter: Coalesce(Subquery(actual), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_counters'),
+        ('recipes', '0015_receipt_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='receipt',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 3.2.3 on 2026-10-18 07:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+FEED_FAN_OUT_LIMIT = 10000
+FEED_BACKFILL = 100
+
+
+def fill_timelines(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Receipt = apps.get_model('recipes', 'Receipt')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    User.objects.filter(subscribers_count__gt=FEED_FAN_OUT_LIMIT).update(
+        fan_out_on_read=True)
+    subscribers = {}
+    for user_id, author_id in Subscribe.objects.filter(
+            author__fan_out_on_read=False).values_list(
+                'user_id', 'author_id').iterator():
+        subscribers.setdefault(author_id, []).append(user_id)
+    for author_id, user_ids in subscribers.items():
+        recipe_ids = list(Receipt.objects.filter(
+            author_id=author_id).order_by('-id').values_list(
+                'id', flat=True)[:FEED_BACKFILL])
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, recipe_id=recipe_id)
+             for user_id in user_ids for recipe_id in recipe_ids),
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0005_user_fan_out_on_read'),
+        ('recipes', '0018_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['author', '-id'], name='receipt_author_id'),
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.receipt', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+                'ordering': ['user', '-recipe'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
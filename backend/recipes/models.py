@@ -1,11 +1,31 @@
+from datetime import timedelta
+
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber, TruncDate
+from django.utils import timezone
 from django.core.validators import RegexValidator
 
-from users.models import User
+from backend.mixins import SavedSeparatelyMixin
+from users.models import Subscribe, User
 from .constants import (CHARFIELD_MAX_LENGTH, COLOR_LENGTH,
+                        FEED_BACKFILL, FEED_FAN_OUT_LIMIT,
                         MAX_COOKING_TIME, MIN_COOKING_TIME,
-                        MIN_AMOUNT, MAX_AMOUNT, HEX_REGEX)
+                        MIN_AMOUNT, MAX_AMOUNT, HEX_REGEX, SEARCH_CONFIG,
+                        POPULARITY_CART_WEIGHT, POPULARITY_FAVORITE_WEIGHT,
+                        POPULARITY_HALF_LIFE_DAYS, POPULARITY_WINDOW_DAYS)
+
+
+def receipt_search_vector():
+    """Выражение полнотекстового индекса receipt_search_vector.
+
+    Должно совпадать с выражением в миграции 0013, иначе PostgreSQL
+    не использует индекс.
+    """
+    from django.contrib.postgres.search import SearchVector
+    return (SearchVector('name', config=SEARCH_CONFIG, weight='A')
+            + SearchVector('text', config=SEARCH_CONFIG, weight='B'))
 
 
 class Tag(models.Model):
@@ -25,12 +45,27 @@ class Tag(models.Model):
         return f'{self.name} ({self.slug})'
 
 
+class IngredientQuerySet(models.QuerySet):
+    def search(self, query):
+        """Ингредиенты, содержащие query; сначала начинающиеся с query."""
+        rank = models.Case(
+            models.When(name__istartswith=query, then=models.Value(1.0)),
+            default=models.Value(0.0), output_field=models.FloatField())
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramSimilarity
+            rank = rank + TrigramSimilarity('name', query)
+        return self.filter(name__icontains=query).annotate(
+            rank=rank).order_by('-rank', 'name')
+
+
 class Ingredient(models.Model):
     name = models.CharField(max_length=CHARFIELD_MAX_LENGTH,
                             verbose_name='Название')
     measurement_unit = models.CharField(max_length=CHARFIELD_MAX_LENGTH,
                                         verbose_name='Единица измерения')
 
+    objects = IngredientQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
@@ -43,12 +78,108 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Receipt(models.Model):
+class ReceiptQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        """Аннотирует флаги избранного и корзины текущего пользователя."""
+        if not user.is_authenticated:
+            return self
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+        )
+
+    def with_related(self, user):
+        """Подгружает автора, тэги и ингредиенты фиксированным числом
+        запросов; у автора аннотируется флаг подписки."""
+        authors = User.objects.only(
+            'id', 'email', 'username', 'first_name', 'last_name')
+        if user.is_authenticated:
+            authors = authors.annotate(
+                is_subscribed=models.Exists(Subscribe.objects.filter(
+                    user=user, author=models.OuterRef('pk'))))
+        return self.prefetch_related(
+            models.Prefetch('author', queryset=authors),
+            models.Prefetch('tags', queryset=Tag.objects.all()),
+            models.Prefetch(
+                'receipt_ingredient',
+                queryset=ReceiptIngredient.objects.select_related(
+                    'ingredient').only(
+                    'id', 'recipe_id', 'amount', 'ingredient__id',
+                    'ingredient__name', 'ingredient__measurement_unit')),
+        )
+
+    def for_representation(self, user):
+        return self.with_user_flags(user).with_related(user)
+
+    def search(self, query):
+        """Поиск по названию и описанию с сортировкой по релевантности.
+
+        В PostgreSQL - полнотекстовый поиск по receipt_search_vector и
+        поиск по вхождению в название через триграммный индекс, в других
+        СУБД - icontains, где совпадения в названии идут первыми.
+        """
+        if connection.vendor != 'postgresql':
+            return self.filter(
+                models.Q(name__icontains=query)
+                | models.Q(text__icontains=query)
+            ).annotate(rank=models.Case(
+                models.When(name__icontains=query, then=models.Value(1.0)),
+                default=models.Value(0.5), output_field=models.FloatField())
+            ).order_by('-rank', '-id')
+        from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                                    TrigramSimilarity)
+        search_query = SearchQuery(query, config=SEARCH_CONFIG,
+                                   search_type='websearch')
+        return self.annotate(search=receipt_search_vector()).filter(
+            models.Q(search=search_query) | models.Q(name__icontains=query)
+        ).annotate(
+            rank=SearchRank(models.F('search'), search_query)
+            + TrigramSimilarity('name', query)
+        ).order_by('-rank', '-id')
+
+    def latest_by_author(self, authors, limit):
+        """Не больше limit последних рецептов каждого из authors.
+
+        Номер рецепта внутри автора считается ROW_NUMBER() в подзапросе,
+        поэтому из базы читаются только нужные строки.
+        """
+        if not authors:
+            return self.none()
+        ranked = Receipt.objects.filter(author__in=authors).annotate(
+            recipe_rank=models.Window(
+                RowNumber(), partition_by=models.F('author_id'),
+                order_by=models.F('id').desc())
+        ).values('id', 'recipe_rank').order_by()
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(id__in=RawSQL(
+            f'SELECT ranked.id FROM ({sql}) ranked '
+            f'WHERE ranked.recipe_rank <= %s', (*params, limit)))
+
+    def popular(self):
+        """Рецепты из рейтинга популярности с местом popularity_position.
+        """
+        return self.filter(popularity__isnull=False).annotate(
+            popularity_position=models.F('popularity__position'))
+
+    def short(self):
+        """Только поля, нужные ReceiptRepresantaionSerializer."""
+        return self.only(
+            'id', 'name', 'image', 'image_variants', 'cooking_time',
+            'author_id')
+
+
+class Receipt(SavedSeparatelyMixin, models.Model):
     ingredients = models.ManyToManyField(Ingredient,
                                          through='ReceiptIngredient')
     tags = models.ManyToManyField(Tag, verbose_name='Тэги')
     image = models.ImageField(upload_to='images/recipes/',
                               verbose_name='Картинка')
+    image_variants = models.JSONField(
+        null=True, blank=True, editable=False,
+        verbose_name='Варианты картинки',
+        help_text='Пусто, пока process_images не обработал картинку')
     name = models.CharField(max_length=CHARFIELD_MAX_LENGTH,
                             verbose_name='Название')
     text = models.TextField(verbose_name='Описание')
@@ -58,11 +189,32 @@ class Receipt(models.Model):
         verbose_name='Время приготовления')
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='recipes', verbose_name='Автор')
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name='Дата изменения')
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В избранном')
+    in_carts_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='В корзинах')
+    similar_updated_at = models.DateTimeField(
+        null=True, blank=True, editable=False,
+        verbose_name='Дата расчёта похожих',
+        help_text='Пусто или раньше даты изменения, пока '
+                  'build_similar_recipes не пересчитал похожие рецепты')
+
+    SAVED_SEPARATELY = ('favorites_count', 'in_carts_count')
+
+    objects = ReceiptQuerySet.as_manager()
 
     class Meta:
         ordering = ['-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['id'], name='receipt_image_pending',
+                         condition=models.Q(image_variants__isnull=True)),
+            models.Index(fields=['author', '-id'],
+                         name='receipt_author_id'),
+        ]
 
     def __str__(self):
         return f'{self.name} - {self.author}'
@@ -95,6 +247,8 @@ class Favorite(models.Model):
     recipe = models.ForeignKey(Receipt, on_delete=models.CASCADE,
                                related_name='favorites',
                                verbose_name='Рецепт')
+    created = models.DateTimeField(auto_now_add=True, db_index=True,
+                                   verbose_name='Дата добавления')
 
     class Meta:
         verbose_name = 'Избранное'
@@ -115,6 +269,8 @@ class ShoppingCart(models.Model):
     recipe = models.ForeignKey(Receipt, on_delete=models.CASCADE,
                                related_name='shopping_carts',
                                verbose_name='Рецепт')
+    created = models.DateTimeField(auto_now_add=True, db_index=True,
+                                   verbose_name='Дата добавления')
 
     class Meta:
         verbose_name = 'Покупка'
@@ -126,3 +282,293 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} - {self.recipe}'
+
+
+class ShoppingListQuerySet(models.QuerySet):
+    def change(self, user_ids, amounts):
+        """Прибавляет amounts ({ingredient_id: количество}, может быть
+        отрицательным) к спискам покупок пользователей user_ids."""
+        amounts = {ingredient_id: amount
+                   for ingredient_id, amount in amounts.items() if amount}
+        if not amounts:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with transaction.atomic():
+            items = {
+                (item.user_id, item.ingredient_id): item
+                for item in self.select_for_update().filter(
+                    user_id__in=user_ids, ingredient_id__in=amounts)}
+            created = []
+            for user_id in user_ids:
+                for ingredient_id, amount in amounts.items():
+                    item = items.get((user_id, ingredient_id))
+                    if item is not None:
+                        item.amount += amount
+                    elif amount > 0:
+                        created.append((user_id, ingredient_id, amount))
+            self.add_rows(created)
+            self.bulk_update(
+                [item for item in items.values() if item.amount > 0],
+                ['amount'])
+            self.filter(pk__in=[item.pk for item in items.values()
+                                if item.amount <= 0]).delete()
+
+    def add_rows(self, rows):
+        """Вставляет строки (user_id, ingredient_id, amount).
+
+        Строку могла только что вставить параллельная транзакция, тогда
+        количество к ней прибавляется, а не падает IntegrityError.
+        """
+        if not rows:
+            return
+        table = self.model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, amount) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(rows))} '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET amount = {table}.amount + EXCLUDED.amount',
+                [value for row in rows for value in row])
+
+    def add_recipe(self, user_ids, recipe_id, sign=1):
+        self.change(user_ids, {
+            ingredient_id: sign * amount for ingredient_id, amount
+            in ReceiptIngredient.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', 'amount')})
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             verbose_name='Пользователь',
+                             related_name='shopping_list')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE,
+                                   related_name='shopping_list',
+                                   verbose_name='Ингредиент')
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='shoppinglistitem_unique')
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.amount}'
+
+
+class TableVersionQuerySet(models.QuerySet):
+    def bump(self, *names):
+        for name in names:
+            if not self.filter(name=name).update(
+                    version=models.F('version') + 1,
+                    updated_at=timezone.now()):
+                self.get_or_create(name=name)
+
+    def get_versions(self, names):
+        """{name: (version, updated_at)}; для таблиц без записей - (0, None).
+        """
+        versions = dict.fromkeys(names, (0, None))
+        versions.update(
+            (name, (version, updated_at))
+            for name, version, updated_at in self.filter(
+                name__in=names).values_list('name', 'version', 'updated_at'))
+        return versions
+
+
+class TableVersion(models.Model):
+    name = models.CharField(max_length=CHARFIELD_MAX_LENGTH, unique=True,
+                            verbose_name='Таблица')
+    version = models.PositiveBigIntegerField(default=1,
+                                             verbose_name='Версия')
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name='Дата изменения')
+
+    objects = TableVersionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Версия таблицы'
+        verbose_name_plural = 'Версии таблиц'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+
+def replace_rows(queryset, rows, batch_size=1000):
+    """Заменяет строки queryset на rows одной транзакцией.
+
+    Старые строки удаляются одним DELETE, без загрузки и без сигналов
+    post_delete: это пересчитываемые данные, их просто выбрасывают.
+    """
+    with transaction.atomic(using=queryset.db):
+        queryset._raw_delete(queryset.db)
+        queryset.model.objects.bulk_create(rows, batch_size=batch_size)
+
+
+class RecipePopularityQuerySet(models.QuerySet):
+    def rebuild(self, half_life=POPULARITY_HALF_LIFE_DAYS,
+                window=POPULARITY_WINDOW_DAYS):
+        """Пересчитывает рейтинг популярности и возвращает число рецептов.
+
+        Добавления группируются базой по рецепту и дню, затухание
+        считается уже по этим группам.
+        """
+        today = timezone.localdate()
+        since = timezone.now() - timedelta(days=window)
+        scores = {}
+        for model, weight in ((Favorite, POPULARITY_FAVORITE_WEIGHT),
+                              (ShoppingCart, POPULARITY_CART_WEIGHT)):
+            for recipe_id, day, total in model.objects.filter(
+                    created__gte=since).values_list(
+                        'recipe_id', TruncDate('created')).annotate(
+                            total=models.Count('*')).order_by().iterator():
+                scores[recipe_id] = scores.get(recipe_id, 0) + (
+                    weight * total * 0.5 ** ((today - day).days / half_life))
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        replace_rows(self.model.objects.all(), (
+            self.model(recipe_id=recipe_id, position=position, score=score)
+            for position, (recipe_id, score) in enumerate(ranked, 1)))
+        return len(ranked)
+
+
+class RecipePopularity(models.Model):
+    recipe = models.OneToOneField(Receipt, on_delete=models.CASCADE,
+                                  primary_key=True,
+                                  related_name='popularity',
+                                  verbose_name='Рецепт')
+    position = models.PositiveIntegerField(unique=True,
+                                           verbose_name='Место')
+    score = models.FloatField(verbose_name='Очки')
+
+    objects = RecipePopularityQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['position']
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+
+    def __str__(self):
+        return f'{self.position}. {self.recipe_id}'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(Receipt, on_delete=models.CASCADE,
+                               related_name='similar_links',
+                               verbose_name='Рецепт')
+    similar = models.ForeignKey(Receipt, on_delete=models.CASCADE,
+                                related_name='similar_to',
+                                verbose_name='Похожий рецепт')
+    position = models.PositiveSmallIntegerField(verbose_name='Место')
+    score = models.FloatField(verbose_name='Близость')
+
+    class Meta:
+        ordering = ['recipe', 'position']
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'position'],
+                                    name='unique_similar_position'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} -> {self.similar_id}'
+
+
+class TimelineEntryQuerySet(models.QuerySet):
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора.
+
+        Если подписчиков больше FEED_FAN_OUT_LIMIT, автор навсегда
+        переводится на чтение при запросе ленты и ленты не трогаются.
+        """
+        subscribers, on_read = User.objects.filter(
+            pk=recipe.author_id).values_list(
+                'subscribers_count', 'fan_out_on_read').get()
+        if not on_read and subscribers > FEED_FAN_OUT_LIMIT:
+            User.objects.filter(pk=recipe.author_id).update(
+                fan_out_on_read=True)
+            on_read = True
+        if on_read:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.model._meta.db_table} '
+                f'(user_id, recipe_id) SELECT user_id, %s '
+                f'FROM {Subscribe._meta.db_table} WHERE author_id = %s',
+                [recipe.pk, recipe.author_id])
+
+    def backfill(self, user_id, author_id):
+        """Добавляет в ленту последние рецепты автора после подписки."""
+        if User.objects.filter(pk=author_id, fan_out_on_read=True).exists():
+            return
+        self.bulk_create(
+            (self.model(user_id=user_id, recipe_id=recipe_id)
+             for recipe_id in Receipt.objects.filter(
+                 author_id=author_id).order_by('-id').values_list(
+                     'id', flat=True)[:FEED_BACKFILL]),
+            ignore_conflicts=True)
+
+    def feed_ids(self, user, position=None, reverse=False, limit=10):
+        """id рецептов ленты после position: от новых к старым, с reverse -
+        от старых к новым.
+
+        Лента пользователя и рецепты авторов, читаемых при запросе,
+        выбираются отдельно по индексам и сливаются.
+        """
+        lookup, sign = ('gt', '') if reverse else ('lt', '-')
+        entries = self.filter(user=user)
+        if position is not None:
+            entries = entries.filter(**{f'recipe_id__{lookup}': position})
+        ids = set(entries.order_by(f'{sign}recipe_id').values_list(
+            'recipe_id', flat=True)[:limit])
+        authors = list(Subscribe.objects.filter(
+            user=user, author__fan_out_on_read=True).values_list(
+                'author_id', flat=True))
+        if authors:
+            recipes = Receipt.objects.filter(author_id__in=authors)
+            if position is not None:
+                recipes = recipes.filter(**{f'id__{lookup}': position})
+            ids.update(recipes.order_by(f'{sign}id').values_list(
+                'id', flat=True)[:limit])
+        return sorted(ids, reverse=not reverse)[:limit]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline',
+                             verbose_name='Пользователь')
+    recipe = models.ForeignKey(Receipt, on_delete=models.CASCADE,
+                               related_name='timeline_entries',
+                               verbose_name='Рецепт')
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['user', '-recipe']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_timeline_entry'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.recipe_id}'
+
+
+class DeletedRecipe(models.Model):
+    recipe_id = models.BigIntegerField(verbose_name='id рецепта')
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True,
+                                      verbose_name='Дата удаления')
+
+    class Meta:
+        verbose_name = 'Удалённый рецепт'
+        verbose_name_plural = 'Удалённые рецепты'
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.deleted_at}'
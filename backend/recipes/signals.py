@@ -0,0 +1,181 @@
+from datetime import timedelta
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from users.models import Subscribe, User
+from .constants import DELETED_RECIPES_KEEP_DAYS
+from .models import (DeletedRecipe, Favorite, Ingredient, Receipt,
+                     ReceiptIngredient, ShoppingCart, ShoppingListItem,
+                     TableVersion, Tag, TimelineEntry)
+
+VERSIONED_MODELS = {
+    Tag: 'tag',
+    Ingredient: 'ingredient',
+    Receipt: 'receipt',
+    User: 'user',
+}
+
+# Считаемая модель: (её внешний ключ, модель со счётчиком, поле счётчика).
+COUNTERS = {
+    Favorite: ('recipe_id', Receipt, 'favorites_count'),
+    ShoppingCart: ('recipe_id', Receipt, 'in_carts_count'),
+    Receipt: ('author_id', User, 'recipes_count'),
+    Subscribe: ('author_id', User, 'subscribers_count'),
+}
+
+# Поля пользователя, которых нет в ответах API: их сохранение (вход
+# обновляет last_login) не сбрасывает ETag и кэш списков рецептов.
+UNVERSIONED_USER_FIELDS = {'last_login', 'password'}
+
+# bulk_create не шлёт post_save, поэтому массовый импорт ингредиентов
+# сообщает о себе отдельным сигналом.
+ingredients_imported = Signal()
+
+
+def bump_table_version(sender, update_fields=None, **kwargs):
+    if (sender is User and update_fields
+            and update_fields <= UNVERSIONED_USER_FIELDS):
+        return
+    TableVersion.objects.bump(VERSIONED_MODELS[sender])
+
+
+# Обработчик без sender срабатывал бы на все модели и запрещал Django
+# быстрое удаление при каскадах.
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_table_version, sender=model)
+    post_delete.connect(bump_table_version, sender=model)
+
+
+@receiver(m2m_changed, sender=Receipt.tags.through)
+def bump_receipt_tags_version(sender, action, **kwargs):
+    if action.startswith('post_'):
+        TableVersion.objects.bump('receipt')
+
+
+@receiver(post_save, sender=ReceiptIngredient)
+def touch_receipt(sender, instance, raw=False, **kwargs):
+    # API пишет ингредиенты массово и сохраняет рецепт сам; поштучно их
+    # сохраняет админка, и индекс поиска по ингредиентам должен увидеть
+    # рецепт изменённым.
+    if not raw:
+        Receipt.objects.filter(pk=instance.recipe_id).update(
+            updated_at=timezone.now())
+        TableVersion.objects.bump('receipt')
+
+
+@receiver(pre_delete, sender=Receipt)
+def expire_similar(sender, instance, **kwargs):
+    # Списки похожих, где стоял удаляемый рецепт, станут короче;
+    # build_similar_recipes дополнит их при следующем запуске.
+    Receipt.objects.filter(similar_links__similar=instance).update(
+        similar_updated_at=None)
+
+
+@receiver(post_delete, sender=Receipt)
+def record_deleted_recipe(sender, instance, **kwargs):
+    # По этим записям индексы в памяти других процессов выбрасывают
+    # рецепт, не перечитывая всю таблицу.
+    DeletedRecipe.objects.create(recipe_id=instance.pk)
+    DeletedRecipe.objects.filter(deleted_at__lt=timezone.now() - timedelta(
+        days=DELETED_RECIPES_KEEP_DAYS)).delete()
+
+
+@receiver(post_save, sender=Receipt)
+def fan_out_receipt(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        TimelineEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Subscribe)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        TimelineEntry.objects.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def clear_timeline(sender, instance, **kwargs):
+    TimelineEntry.objects.filter(
+        user_id=instance.user_id,
+        recipe__author_id=instance.author_id).delete()
+
+
+# Список покупок - сумма по парам (рецепт в корзине, ингредиент рецепта).
+# Каждый обработчик прибавляет или вычитает пары, существующие в момент
+# изменения, поэтому при каскадном удалении рецепта или пользователя
+# каждая пара вычитается ровно один раз, в каком бы порядке Django ни
+# удалял корзины и ингредиенты. Массовые операции API сигналов не шлют
+# и меняют списки сами.
+def cart_users(recipe_id):
+    return ShoppingCart.objects.filter(recipe_id=recipe_id).values_list(
+        'user_id', flat=True)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ShoppingListItem.objects.add_recipe([instance.user_id],
+                                            instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    ShoppingListItem.objects.add_recipe([instance.user_id],
+                                        instance.recipe_id, sign=-1)
+
+
+@receiver(pre_save, sender=ReceiptIngredient)
+def remember_ingredient(sender, instance, raw=False, **kwargs):
+    instance._saved_amount = None
+    if not raw and not instance._state.adding:
+        instance._saved_amount = ReceiptIngredient.objects.filter(
+            pk=instance.pk).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=ReceiptIngredient)
+def change_shopping_lists(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    amounts = {instance.ingredient_id: instance.amount}
+    saved = getattr(instance, '_saved_amount', None)
+    if saved is not None:
+        ingredient_id, amount = saved
+        amounts[ingredient_id] = amounts.get(ingredient_id, 0) - amount
+    ShoppingListItem.objects.change(cart_users(instance.recipe_id), amounts)
+
+
+@receiver(post_delete, sender=ReceiptIngredient)
+def remove_ingredient_from_shopping_lists(sender, instance, **kwargs):
+    ShoppingListItem.objects.change(cart_users(instance.recipe_id),
+                                    {instance.ingredient_id: -instance.amount})
+
+
+@receiver(ingredients_imported)
+def bump_ingredient_version(sender, **kwargs):
+    TableVersion.objects.bump('ingredient')
+
+
+def change_counter(instance, delta):
+    field, model, counter = COUNTERS[type(instance)]
+    # Greatest не даёт разошедшемуся счётчику уйти ниже нуля; точные
+    # значения восстанавливает rebuild_counters.
+    model.objects.filter(pk=getattr(instance, field)).update(
+        **{counter: Greatest(F(counter) + delta, 0)})
+
+
+def count_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(instance, 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    change_counter(instance, -1)
+
+
+for model in COUNTERS:
+    post_save.connect(count_created, sender=model)
+    post_delete.connect(count_deleted, sender=model)
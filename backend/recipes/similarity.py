@@ -0,0 +1,112 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import groupby
+from math import log, sqrt
+from operator import itemgetter
+
+from .constants import (SIMILAR_CANDIDATES_BUDGET, SIMILAR_RESCORE_FACTOR,
+                        SIMILAR_TAG_WEIGHT, SIMILAR_TOP)
+from .models import Receipt, ReceiptIngredient, SimilarRecipe, replace_rows
+
+
+def recipe_features():
+    """Пары (id рецепта, признак) по возрастанию id рецепта.
+
+    Признак ингредиента - 2 * id, признак тега - 2 * id + 1.
+    """
+    ingredients = ReceiptIngredient.objects.values_list(
+        'recipe_id', 'ingredient_id').order_by('recipe_id').iterator()
+    tags = Receipt.tags.through.objects.values_list(
+        'receipt_id', 'tag_id').order_by('receipt_id').iterator()
+    return heapq.merge(
+        ((recipe_id, 2 * ingredient_id)
+         for recipe_id, ingredient_id in ingredients),
+        ((recipe_id, 2 * tag_id + 1) for recipe_id, tag_id in tags),
+        key=itemgetter(0))
+
+
+class RecipeVectors:
+    """Разреженные векторы всех рецептов в памяти.
+
+    Вес признака - idf: чем реже ингредиент, тем больше он говорит о
+    рецепте. Рецепты пронумерованы подряд по возрастанию id, признаки
+    рецепта i лежат в общем массиве в срезе offsets[i]:offsets[i + 1].
+    """
+
+    def __init__(self, rows):
+        self.ids, self.offsets, self.features = (
+            array('I'), array('I', [0]), array('I'))
+        for recipe_id, group in groupby(rows, key=itemgetter(0)):
+            self.ids.append(recipe_id)
+            self.features.extend(sorted({feature for _, feature in group}))
+            self.offsets.append(len(self.features))
+        frequency = Counter(self.features)
+        total = len(self.ids)
+        # Сглаженный idf: признак, который есть у всех рецептов, всё же
+        # имеет ненулевой вес.
+        self.weights = {
+            feature: ((log((1 + total) / (1 + count)) + 1)
+                      * (SIMILAR_TAG_WEIGHT if feature & 1 else 1)) ** 2
+            for feature, count in frequency.items()}
+        self.frequency = frequency
+        self.postings = {feature: array('I') for feature in frequency}
+        self.norms = array('d')
+        for index in range(total):
+            features = self.vector(index)
+            for feature in features:
+                self.postings[feature].append(index)
+            self.norms.append(sqrt(sum(
+                self.weights[feature] for feature in features)))
+
+    def vector(self, index):
+        return self.features[self.offsets[index]:self.offsets[index + 1]]
+
+    def index(self, recipe_id):
+        index = bisect_left(self.ids, recipe_id)
+        if index < len(self.ids) and self.ids[index] == recipe_id:
+            return index
+        return None
+
+    def neighbours(self, index, top=SIMILAR_TOP):
+        """[(близость, id рецепта)] по убыванию близости.
+
+        Возвращает до top * SIMILAR_RESCORE_FACTOR рецептов с точной
+        косинусной близостью; похожие - первые top из них.
+        """
+        features = self.vector(index)
+        # Близость по самым редким признакам, пока хватает бюджета:
+        # частые признаки вроде соли почти не влияют на порядок.
+        partial, budget = {}, SIMILAR_CANDIDATES_BUDGET
+        for feature in sorted(features, key=self.frequency.__getitem__):
+            if budget <= 0:
+                break
+            # Самые новые рецепты в конце списка.
+            posting = self.postings[feature][-budget:]
+            budget -= len(posting)
+            weight = self.weights[feature]
+            for other in posting:
+                partial[other] = partial.get(other, 0) + weight
+        partial.pop(index, None)
+        norms = self.norms
+        features = set(features)
+        scores = []
+        for other in heapq.nlargest(
+                top * SIMILAR_RESCORE_FACTOR, partial,
+                key=lambda other: partial[other] / norms[other]):
+            dot = sum(self.weights[feature] for feature in self.vector(other)
+                      if feature in features)
+            scores.append((dot / (norms[index] * norms[other]),
+                           self.ids[other]))
+        scores.sort(reverse=True)
+        return scores
+
+
+def save_neighbours(neighbours, top=SIMILAR_TOP):
+    """Заменяет списки похожих {id рецепта: [(близость, id)]}."""
+    replace_rows(SimilarRecipe.objects.filter(recipe_id__in=neighbours), (
+        SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                      position=position, score=score)
+        for recipe_id, scores in neighbours.items()
+        for position, (score, similar_id) in enumerate(scores[:top], 1)))
@@ -0,0 +1,37 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где имя файла - sha256 его содержимого.
+
+    Файл images/recipes/temp.jpeg сохраняется как
+    images/recipes/ab/ab12...ef.jpeg. Одинаковые загрузки ложатся в один
+    файл, а файл по имени никогда не меняется, поэтому nginx отдаёт его
+    с immutable-кэшированием. Удаляет ненужные файлы команда gc_media.
+    """
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Свежая дата изменения не даёт gc_media удалить файл, на
+            # который вот-вот сошлётся новый рецепт.
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in iter(lambda: content.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        content.seek(0)
+        directory, basename = posixpath.split(name)
+        ext = posixpath.splitext(basename)[1].lower()
+        digest = digest.hexdigest()
+        return posixpath.join(directory, digest[:2], digest + ext)
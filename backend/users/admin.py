@@ -6,6 +6,8 @@ from .models import User, Subscribe
 class UserAdmin(admin.ModelAdmin):
     list_filter = ('username', 'email')
     exclude = ('password',)
+    list_display = ('username', 'email', 'recipes_count',
+                    'subscribers_count')
 
 
 admin.site.register(User, UserAdmin)
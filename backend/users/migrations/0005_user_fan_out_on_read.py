@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='fan_out_on_read',
+            field=models.BooleanField(default=False, editable=False, help_text='Ставится, когда у автора становится больше FEED_FAN_OUT_LIMIT подписчиков: его рецепты не раскладываются по лентам, лента читает их сама', verbose_name='Рецепты в ленты при чтении'),
+        ),
+    ]
@@ -2,10 +2,12 @@ from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
+from backend.mixins import SavedSeparatelyMixin
+
 from .constants import EMAIL_LENGTH, NAME_LENGTH
 
 
-class User(AbstractUser):
+class User(SavedSeparatelyMixin, AbstractUser):
     email = models.EmailField(max_length=EMAIL_LENGTH, unique=True,
                               verbose_name='Почта')
     username = models.CharField(max_length=NAME_LENGTH, unique=True,
@@ -14,6 +16,20 @@ class User(AbstractUser):
                                   verbose_name='Имя')
     last_name = models.CharField(max_length=NAME_LENGTH, blank=True,
                                  verbose_name='Фамилия')
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Число рецептов')
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Число подписчиков')
+    fan_out_on_read = models.BooleanField(
+        default=False, editable=False,
+        verbose_name='Рецепты в ленты при чтении',
+        help_text='Ставится, когда у автора становится больше '
+                  'FEED_FAN_OUT_LIMIT подписчиков: его рецепты не '
+                  'раскладываются по лентам, лента читает их сама')
+
+    # Флаг fan_out_on_read ставит UPDATE при раскладке рецепта по лентам.
+    SAVED_SEPARATELY = ('recipes_count', 'subscribers_count',
+                        'fan_out_on_read')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']